@@ -1,26 +1,141 @@
 import os
 import csv
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 import torchvision.models as models
 import torch.nn as nn
 from PIL import Image
 import torch
 from torch.utils.data import Dataset
 
+from src.dataset.labels import labels_npz_path
+from src.dataset.subset import read_subset
+from src.utils.roi import RoiCrop, format_roi
+
+
+DEFAULT_IMAGE_CACHE_DIR = 'image_cache'
+
+
+def manifest_hash(samples, root_dir):
+    """
+    Hash of the dataset content: every (file, label) row of the CSV plus the size
+    and modification time of each image, so caches are rebuilt when an image or
+    a label changes.
+    """
+    digest = hashlib.sha256()
+    for file_name, lat, lon in samples:
+        stat = os.stat(os.path.join(root_dir, file_name))
+        digest.update(f"{file_name}\t{lat!r}\t{lon!r}\t{stat.st_size}\t{stat.st_mtime_ns}\n".encode('utf-8'))
+    return digest.hexdigest()
+
+
+def decode_image(img_path, size, roi=None):
+    # Same ROI crop and bilinear PIL resize as get_transform(size, roi), kept as CHW uint8.
+    with Image.open(img_path) as image:
+        image = RoiCrop(roi)(image.convert('RGB')).resize((size, size), Image.BILINEAR)
+        return np.asarray(image, dtype=np.uint8).transpose(2, 0, 1)
+
+
+def build_image_cache(samples, root_dir, size, path, workers=8, roi=None):
+    """Decode and resize every image once into a (N, 3, size, size) uint8 .npy file."""
+    tmp_path = path + '.tmp'
+    images = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.uint8,
+                                       shape=(len(samples), 3, size, size))
+
+    def store(index):
+        images[index] = decode_image(os.path.join(root_dir, samples[index][0]), size, roi)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(store, range(len(samples))))
+
+    images.flush()
+    del images
+    os.replace(tmp_path, path)
+    return path
+
+
+def load_labels(csv_file):
+    """
+    (file_name, lat, lon) rows of a label file, lat/lon normalized like the model
+    outputs. Reads the columnar .npz written by src.dataset.labels instead of
+    the CSV when it is up to date.
+    """
+    npz_path = labels_npz_path(csv_file)
+    if csv_file.endswith('.npz') or (os.path.exists(npz_path)
+                                     and os.path.getmtime(npz_path) >= os.path.getmtime(csv_file)):
+        with np.load(npz_path) as labels:
+            lat = (labels['lat'] - 47.39) * 1000.0
+            lon = (labels['lon'] + 1.18) * 1000.0
+            return list(zip(labels['file_name'].tolist(), lat.tolist(), lon.tolist()))
+
+    samples = []
+    with open(csv_file, 'r') as f:
+        reader = csv.DictReader(f)
+        for row in reader:
+            file_name = row['file_name']
+            lat = (float(row['lat']) - 47.39) * 1000.0
+            lon = (float(row['lon']) + 1.18) * 1000.0
+            # lat = float(row['lat']) * 1000.0
+            # lon = float(row['lon']) * 1000.0
+            samples.append((file_name, lat, lon))
+    return samples
+
+
 class MyDataset(Dataset):
-    def __init__(self, csv_file, root_dir, transform=None):
+    """
+    csv_file / root_dir: labels (CSV or the .npz of src.dataset.labels) and images.
+    transform: applied to the PIL image (or, with cache_size, to the float tensor).
+    cache_size: decode every image once at this resolution into a uint8
+        memory-mapped file in cache_dir (default: ./image_cache, outside the
+        dataset tree, which may be read-only) and serve
+        __getitem__ from it. The result matches T.Resize((cache_size, cache_size))
+        + T.ToTensor() without decoding a PNG per access.
+    roi: (left, top, right, bottom) fractions cropped from every image before
+        the transform (see src.utils.roi). Leave it None when the transform
+        already crops, e.g. evaluate.get_transform(size, roi).
+    subset: subset manifest (src.dataset.subset), only its frames are kept.
+    """
+
+    def __init__(self, csv_file, root_dir, transform=None, cache_size=None, cache_dir=None, cache_workers=8,
+                 roi=None, subset=None):
         self.root_dir = root_dir
         self.transform = transform
-        self.samples = []
-
-        with open(csv_file, 'r') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                file_name = row['file_name']
-                lat = (float(row['lat']) - 47.39) * 1000.0
-                lon = (float(row['lon']) + 1.18) * 1000.0
-                # lat = float(row['lat']) * 1000.0
-                # lon = float(row['lon']) * 1000.0
-                self.samples.append((file_name, lat, lon))
+        self.roi = roi
+        self.samples = load_labels(csv_file)
+        self.images = None
+
+        if subset is not None:
+            # Matched on the names relative to the dataset root, so a subset made on
+            # the originals also selects the frames of a resized copy of the tree.
+            _, files = read_subset(subset)
+            keep = set(files)
+            self.samples = [sample for sample in self.samples if sample[0].replace(os.sep, '/') in keep]
+            if not self.samples:
+                raise ValueError(f"No row of {csv_file} is in the subset {subset} (file names must be relative "
+                                 f"to the same dataset root)")
+
+        if cache_size is not None:
+            self.images = self.load_image_cache(cache_size, cache_dir or DEFAULT_IMAGE_CACHE_DIR, cache_workers)
+
+    def load_image_cache(self, size, cache_dir, workers=8):
+        manifest = manifest_hash(self.samples, self.root_dir)
+        roi = '' if self.roi is None else f"roi{format_roi(self.roi).replace(',', '-')}_"
+        # The cache folder can be shared by several datasets, only this root's old caches are replaced.
+        root = hashlib.sha256(os.path.abspath(self.root_dir).encode('utf-8')).hexdigest()[:8]
+        prefix = f"images_{size}_{roi}{root}_"
+        path = os.path.join(cache_dir, f"{prefix}{manifest[:16]}.npy")
+        if not os.path.exists(path):
+            os.makedirs(cache_dir, exist_ok=True)
+            # Caches of older versions of the dataset are never read again
+            # (same prefix + 16 hex digits + .npy, other ROIs are kept).
+            for name in os.listdir(cache_dir):
+                if name.startswith(prefix) and len(name) == len(prefix) + 20:
+                    os.remove(os.path.join(cache_dir, name))
+            print(f"Building image cache {path}")
+            build_image_cache(self.samples, self.root_dir, size, path, workers, self.roi)
+        # Copy-on-write mapping: writable for torch.from_numpy, nothing is copied on read.
+        return np.load(path, mmap_mode='c')
 
     def __len__(self):
         return len(self.samples)
@@ -28,9 +143,19 @@ class MyDataset(Dataset):
     def __getitem__(self, idx):
 
         file_name, label1, label2 = self.samples[idx]
+
+        if self.images is not None:
+            image = torch.from_numpy(self.images[idx]).float().div_(255.0)
+            if self.transform:
+                image = self.transform(image)
+            labels = torch.tensor([label1, label2], dtype=torch.float)
+            return image, labels
+
         img_path = os.path.join(self.root_dir, file_name)
 
         image = Image.open(img_path).convert('RGB')
+        if self.roi is not None:
+            image = RoiCrop(self.roi)(image)
 
         if self.transform:
             image = self.transform(image)
@@ -0,0 +1,180 @@
+import argparse
+import csv
+import json
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+IMAGE_EXTENSIONS = ('.png',)
+PART_PATTERN = re.compile(r"part\d+$")
+
+
+def natural_key(name):
+    # frame_2.png before frame_10.png, so the rows follow the recording order.
+    return [int(part) if part.isdigit() else part for part in re.split(r"(\d+)", name)]
+
+
+def find_parts(root_dir):
+    """Every partXXX directory directly under root_dir."""
+    return sorted(os.path.join(root_dir, entry.name) for entry in os.scandir(root_dir)
+                  if entry.is_dir() and PART_PATTERN.match(entry.name))
+
+
+def scan_directory(directory, prefix=''):
+    """(relative name -> os.stat_result) of every file below directory, one scandir per folder."""
+    files = {}
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            name = prefix + entry.name
+            if entry.is_dir():
+                files.update(scan_directory(entry.path, name + '/'))
+            elif entry.is_file():
+                files[name] = entry.stat()
+    return files
+
+
+def read_part(part_dir, previous=None):
+    """
+    Labels of every image of a part directory that has a JSON with lat/lon next
+    to it. previous is the manifest of the last run for this part
+    ({image: [json_size, json_mtime_ns, lat, lon]}): a JSON with the same size
+    and mtime is not read again. Returns (manifest, counters).
+    """
+    previous = previous or {}
+    files = scan_directory(part_dir)
+    manifest = {}
+    counters = {'images': 0, 'parsed': 0, 'reused': 0, 'missing_json': 0, 'invalid_json': 0}
+
+    for name in sorted(files, key=natural_key):
+        if not name.lower().endswith(IMAGE_EXTENSIONS):
+            continue
+        counters['images'] += 1
+        json_name = os.path.splitext(name)[0] + '.json'
+        stat = files.get(json_name)
+        if stat is None:
+            counters['missing_json'] += 1
+            print(f"Warning: No matching JSON for image {os.path.join(part_dir, name)}")
+            continue
+
+        entry = previous.get(name)
+        if entry is not None and entry[0] == stat.st_size and entry[1] == stat.st_mtime_ns:
+            manifest[name] = entry
+            counters['reused'] += 1
+            continue
+
+        try:
+            with open(os.path.join(part_dir, json_name), 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            counters['invalid_json'] += 1
+            print(f"Warning: Could not read {os.path.join(part_dir, json_name)}: {e}")
+            continue
+        lat, lon = data.get('lat'), data.get('lon')
+        if lat is None or lon is None:
+            counters['invalid_json'] += 1
+            print(f"Warning: 'lat' or 'lon' not found in {os.path.join(part_dir, json_name)}")
+            continue
+        manifest[name] = [stat.st_size, stat.st_mtime_ns, float(lat), float(lon)]
+        counters['parsed'] += 1
+
+    return manifest, counters
+
+
+def manifest_path(output_csv):
+    return os.path.splitext(output_csv)[0] + '_manifest.json'
+
+
+def labels_npz_path(csv_file):
+    return os.path.splitext(csv_file)[0] + '.npz'
+
+
+def write_labels(rows, output_csv):
+    """
+    Write the (file_name, lat, lon) rows as CSV and as a columnar .npz next to it
+    (file_name, lat, lon arrays), which MyDataset loads without parsing text.
+    """
+    directory = os.path.dirname(output_csv)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    with open(output_csv + '.tmp', 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['file_name', 'lat', 'lon'])
+        writer.writerows(rows)
+    os.replace(output_csv + '.tmp', output_csv)
+
+    # Written after the CSV, so an up-to-date .npz is never older than its CSV.
+    npz_path = labels_npz_path(output_csv)
+    with open(npz_path + '.tmp', 'wb') as f:
+        np.savez(f, file_name=np.array([row[0] for row in rows], dtype=str),
+                 lat=np.array([row[1] for row in rows], dtype=np.float64),
+                 lon=np.array([row[2] for row in rows], dtype=np.float64))
+    os.replace(npz_path + '.tmp', npz_path)
+    return output_csv, npz_path
+
+
+def build_labels(part_dirs, root_dir, output_csv='dataset.csv', workers=None):
+    """
+    Build the label CSV (and .npz) of every image of part_dirs, file names relative
+    to root_dir. The parts are read in parallel and only the JSON files changed
+    since the last run (manifest next to the CSV) are parsed. Returns the counters.
+    """
+    start = time.perf_counter()
+    path = manifest_path(output_csv)
+    previous = {}
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            previous = json.load(f).get('parts', {})
+
+    names = [os.path.relpath(part_dir, root_dir) for part_dir in part_dirs]
+    workers = max(1, min(workers or os.cpu_count() or 1, len(part_dirs)))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(read_part, part_dirs, [previous.get(name) for name in names]))
+
+    rows = []
+    totals = {}
+    for name, (manifest, counters) in zip(names, results):
+        for file_name, (_, _, lat, lon) in manifest.items():
+            rows.append((file_name if name == '.' else f"{name}/{file_name}".replace(os.sep, '/'), lat, lon))
+        for key, value in counters.items():
+            totals[key] = totals.get(key, 0) + value
+
+    write_labels(rows, output_csv)
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump({'parts': dict(zip(names, (manifest for manifest, _ in results)))}, f)
+    os.replace(path + '.tmp', path)
+
+    totals['rows'] = len(rows)
+    totals['time_s'] = time.perf_counter() - start
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build dataset.csv (and dataset.npz) from the frame JSON files.')
+    parser.add_argument('--root', type=str, default=os.getenv('DATASET_PATH') or '.',
+                        help='Folder containing the partXXX directories (default: $DATASET_PATH).')
+    parser.add_argument('--parts', type=str, nargs='*', default=None,
+                        help='Part directories relative to --root (default: every partXXX).')
+    parser.add_argument('--output', type=str, default='dataset.csv',
+                        help='Label CSV, the .npz and the manifest are written next to it.')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Parts read in parallel (default: one process per CPU).')
+    args = parser.parse_args()
+
+    part_dirs = ([os.path.join(args.root, part) for part in args.parts] if args.parts
+                 else find_parts(args.root))
+    if not part_dirs:
+        parser.error(f"no partXXX directory in {args.root}")
+
+    totals = build_labels(part_dirs, args.root, args.output, args.workers)
+    print(f"{totals['rows']} labels from {len(part_dirs)} parts written to {args.output} and "
+          f"{labels_npz_path(args.output)} in {totals['time_s']:.2f} s")
+    print(f"{totals['parsed']} JSON parsed, {totals['reused']} unchanged, {totals['missing_json']} images without "
+          f"JSON, {totals['invalid_json']} JSON unreadable or without lat/lon")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+import argparse
+import os
+import time
+
+import torch
+import torchvision.transforms as T
+from torch.utils.data import DataLoader
+
+from src.dataset.dataset import DEFAULT_IMAGE_CACHE_DIR, MyDataset
+from src.utils.roi import add_roi_argument
+
+
+def add_loader_arguments(parser):
+    parser.add_argument('--workers', type=int, default=0,
+                        help='DataLoader worker processes (0 loads in the training process).')
+    parser.add_argument('--persistent-workers', action='store_true',
+                        help='Keep the DataLoader workers alive between epochs.')
+    parser.add_argument('--prefetch-factor', type=int, default=2,
+                        help='Batches loaded in advance by each worker.')
+    parser.add_argument('--image-cache', action='store_true',
+                        help='Decode the images once into a uint8 memory-mapped cache at the model resolution.')
+    parser.add_argument('--image-cache-dir', type=str, default=DEFAULT_IMAGE_CACHE_DIR,
+                        help='Folder of the --image-cache files (default: ./image_cache, never the dataset tree '
+                             'unless given).')
+    parser.add_argument('--shards', type=str, default=None,
+                        help='Read the frames from this folder of packed shards (src.dataset.shards) '
+                             'instead of the loose images.')
+    parser.add_argument('--subset', type=str, default=None,
+                        help='Only use the frames of this subset manifest (src.dataset.subset).')
+    add_roi_argument(parser)
+    return parser
+
+
+def loader_options_from_args(args):
+    return {
+        'num_workers': args.workers,
+        'persistent_workers': args.persistent_workers,
+        'prefetch_factor': args.prefetch_factor,
+    }
+
+
+def make_loader(dataset, batch_size, shuffle=False, num_workers=0, persistent_workers=False, prefetch_factor=2,
+                **kwargs):
+    """DataLoader with the worker options only passed when they are valid (num_workers > 0)."""
+    options = {'pin_memory': torch.cuda.is_available(), **kwargs}
+    if num_workers > 0:
+        options.update(num_workers=num_workers, persistent_workers=persistent_workers,
+                       prefetch_factor=prefetch_factor)
+    return DataLoader(dataset, batch_size=batch_size, shuffle=shuffle, **options)
+
+
+def make_dataset(csv_file, root_dir, size, image_cache=False, roi=None, shard_dir=None, subset=None,
+                 cache_dir=None):
+    """
+    MyDataset returning (3, size, size) float tensors of the ROI, from the image
+    cache (in cache_dir) or from packed shards when asked, restricted to a subset manifest.
+    The shards must have been packed from csv_file and, when it is there, from
+    root_dir as it is now (the loose images are not needed to train from shards).
+    """
+    if shard_dir is not None:
+        if subset is not None:
+            raise ValueError("Pack the shards from the subset instead of combining --shards and --subset")
+        if image_cache:
+            raise ValueError("--image-cache does not apply to --shards, use one or the other")
+        from src.dataset.shards import ShardDataset, is_up_to_date
+        if not is_up_to_date(csv_file, root_dir, shard_dir, check_images=os.path.isdir(root_dir)):
+            raise ValueError(f"{shard_dir} was not packed from {csv_file} and {root_dir} as they are now, pack it "
+                             f"again with python -m src.dataset.shards --csv {csv_file} --root {root_dir} "
+                             f"--output {shard_dir}")
+        return ShardDataset(shard_dir, T.Compose([T.Resize((size, size)), T.ToTensor()]), roi)
+    if image_cache:
+        return MyDataset(csv_file=csv_file, root_dir=root_dir, cache_size=size, cache_dir=cache_dir, roi=roi,
+                         subset=subset)
+    transform = T.Compose([
+        T.Resize((size, size)),
+        T.ToTensor(),
+    ])
+    return MyDataset(csv_file=csv_file, root_dir=root_dir, transform=transform, roi=roi, subset=subset)
+
+
+def benchmark_loader(loader, epochs=1):
+    """Iterate the loader alone (no model), returns images/s per epoch."""
+    throughputs = []
+    for _ in range(epochs):
+        images_seen = 0
+        start = time.perf_counter()
+        for images, _ in loader:
+            images_seen += len(images)
+        throughputs.append(images_seen / (time.perf_counter() - start))
+    return throughputs
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the DataLoader throughput alone, without the model.')
+    parser.add_argument('--csv', type=str, default='dataset.csv',
+                        help='CSV file with the labels.')
+    parser.add_argument('--root', type=str, default='./resizeDataSet',
+                        help='Folder containing the images.')
+    parser.add_argument('--size', type=int, default=380,
+                        help='Model input resolution.')
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--epochs', type=int, default=2,
+                        help='Number of passes; later epochs show the effect of persistent workers and the page cache.')
+    add_loader_arguments(parser)
+    args = parser.parse_args()
+
+    dataset = make_dataset(args.csv, args.root, args.size, args.image_cache, args.roi, args.shards, args.subset,
+                           args.image_cache_dir)
+    loader = make_loader(dataset, args.batch_size, shuffle=True, **loader_options_from_args(args))
+
+    for epoch, throughput in enumerate(benchmark_loader(loader, args.epochs)):
+        print(f"Epoch {epoch + 1}: {throughput:.1f} images/s")
+
+
+if __name__ == '__main__':
+    main()
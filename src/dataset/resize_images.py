@@ -1,35 +1,158 @@
-from PIL import Image
-from concurrent.futures import ThreadPoolExecutor
+import argparse
+import json
 import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 
+from PIL import Image
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.gif', '.tiff')
+
+# Written in the output tree after a complete run: the size and filter of its images.
+SETTINGS_FILE = 'resize.json'
+
+# Bilinear is what T.Resize / decode_image use, so without --roi a pre-resized image
+# at the model resolution gives exactly the same input as resizing the original on
+# the fly. With --roi it does not: the crop is taken from the already squashed
+# image and resized up again, so keep the pre-resized images larger than the model
+# input (or train on the originals) when cropping.
+RESAMPLING = {
+    'bilinear': Image.BILINEAR,
+    'lanczos': Image.LANCZOS,
+}
 
-def process_image(input_path, output_path, size=(256, 256)):
-    try:
 
+def process_image(input_path, output_path, size=(256, 256), resample='bilinear'):
+    """Resize one image, returns None or the error message (the worker never hides it)."""
+    # Written under a temporary name, an interrupted run never leaves a
+    # truncated file that looks up to date.
+    tmp_path = output_path + '.tmp'
+    try:
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
         with Image.open(input_path) as img:
-            img_resized = img.resize(size, Image.LANCZOS)
-            img_resized.save(output_path)
+            img_resized = img.resize(size, RESAMPLING[resample])
+            img_resized.save(tmp_path, format=img.format)
+        os.replace(tmp_path, output_path)
+        return None
     except Exception as e:
-        print(f"Error processing {input_path}: {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return f"{type(e).__name__}: {e}"
 
 
-def resize_images_in_directory(base_input_dir, base_output_dir, size=(256, 256), max_workers=8):
-    tasks = []
+def read_settings(base_output_dir):
+    try:
+        with open(os.path.join(base_output_dir, SETTINGS_FILE), 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
 
+
+def list_tasks(base_input_dir, base_output_dir, force=False):
+    """
+    (input, output) pairs of the images whose output is missing or older than
+    the input (every image with force), and the skipped count.
+    """
+    tasks = []
+    skipped = 0
     for root, dirs, files in os.walk(base_input_dir):
         relative_path = os.path.relpath(root, base_input_dir)
-        output_dir = os.path.join(base_output_dir, relative_path)
+        output_dir = os.path.normpath(os.path.join(base_output_dir, relative_path))
+        # Never walk into the output tree when it lives inside the input one.
+        dirs[:] = [d for d in dirs if os.path.abspath(os.path.join(root, d)) != os.path.abspath(base_output_dir)]
 
         for file in files:
-            if file.lower().endswith(('.png', '.jpg', '.jpeg', '.bmp', '.gif', '.tiff')):
+            if file.lower().endswith(IMAGE_EXTENSIONS):
                 input_path = os.path.join(root, file)
                 output_path = os.path.join(output_dir, file)
-                tasks.append((input_path, output_path, size))
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        executor.map(lambda task: process_image(*task), tasks)
+                if force:
+                    tasks.append((input_path, output_path))
+                    continue
+                try:
+                    if os.stat(output_path).st_mtime_ns >= os.stat(input_path).st_mtime_ns:
+                        skipped += 1
+                        continue
+                except FileNotFoundError:
+                    pass
+                tasks.append((input_path, output_path))
+    return tasks, skipped
 
 
-if __name__ == "__main__":
-  DATASET_PATH = "./part000"
+def resize_images_in_directory(base_input_dir, base_output_dir, size=(256, 256), max_workers=None,
+                               resample='bilinear'):
+    """
+    Resize every image of base_input_dir into the same relative path under
+    base_output_dir with a pool of processes (PIL resizing holds the GIL).
+    Up-to-date images are only skipped when the output tree was made with the
+    same size and filter (SETTINGS_FILE), otherwise everything is resized again.
+    Returns a dict with the resized/skipped counts, the time and the failures.
+    """
+    if os.path.abspath(base_input_dir) == os.path.abspath(base_output_dir):
+        raise ValueError("The output directory must differ from the input one, originals are never overwritten")
+
+    start = time.perf_counter()
+    settings = {'size': list(size), 'resample': resample}
+    settings_path = os.path.join(base_output_dir, SETTINGS_FILE)
+    force = read_settings(base_output_dir) != settings
+    if force and os.path.exists(settings_path):
+        # Removed first: an interrupted run leaves a tree that is resized again next time.
+        os.remove(settings_path)
+    tasks, skipped = list_tasks(base_input_dir, base_output_dir, force)
+    failures = []
+    if tasks:
+        inputs = [input_path for input_path, _ in tasks]
+        outputs = [output_path for _, output_path in tasks]
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            for input_path, error in zip(inputs, executor.map(process_image, inputs, outputs, repeat(size),
+                                                               repeat(resample), chunksize=32)):
+                if error is not None:
+                    failures.append((input_path, error))
+                    print(f"Error processing {input_path}: {error}")
+
+    if not failures:
+        os.makedirs(base_output_dir, exist_ok=True)
+        with open(settings_path, 'w') as f:
+            json.dump(settings, f)
+
+    return {
+        'resized': len(tasks) - len(failures),
+        'skipped': skipped,
+        'failures': failures,
+        'time_s': time.perf_counter() - start,
+    }
+
+
+def main():
+    # Import here, the module is also imported by the worker processes.
+    from src.model.networks import ARCHITECTURES
 
-  resize_images_in_directory(DATASET_PATH, DATASET_PATH, (224, 224))
+    parser = argparse.ArgumentParser(description='Resize the dataset once to the resolution the model consumes.')
+    parser.add_argument('--input', type=str, default=os.getenv('DATASET_PATH') or './part000',
+                        help='Folder of the original images (default: $DATASET_PATH).')
+    parser.add_argument('--output', type=str, default='./resizeDataSet',
+                        help='Output tree, same relative paths as the input.')
+    parser.add_argument('--arch', type=str, default='b4', choices=list(ARCHITECTURES),
+                        help='Resize to the input resolution of this architecture.')
+    parser.add_argument('--size', type=int, default=None,
+                        help='Explicit resolution (overrides --arch).')
+    parser.add_argument('--resample', type=str, default='bilinear', choices=list(RESAMPLING),
+                        help='Resampling filter (bilinear matches the training transform).')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Worker processes (default: one per CPU).')
+    args = parser.parse_args()
+
+    if os.path.abspath(args.input) == os.path.abspath(args.output):
+        parser.error('--output must differ from --input, originals are never overwritten')
+    size = args.size or ARCHITECTURES[args.arch].input_size
+    stats = resize_images_in_directory(args.input, args.output, (size, size), args.workers, args.resample)
+
+    files_per_s = stats['resized'] / stats['time_s'] if stats['time_s'] > 0 else 0.0
+    print(f"{stats['resized']} images resized to {size}x{size} in {stats['time_s']:.2f} s ({files_per_s:.1f} files/s), "
+          f"{stats['skipped']} up to date, {len(stats['failures'])} failed")
+    if stats['failures']:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
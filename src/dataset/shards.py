@@ -0,0 +1,299 @@
+import argparse
+import csv
+import hashlib
+import io
+import json
+import os
+import random
+import shutil
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import torch
+from PIL import Image
+from torch.utils.data import Dataset, IterableDataset, get_worker_info
+
+from src.dataset.dataset import MyDataset, manifest_hash
+from src.utils.roi import RoiCrop
+
+# One row per frame: where its encoded image is and its raw coordinates.
+INDEX_DTYPE = np.dtype([('shard', np.int32), ('offset', np.int64), ('length', np.int64),
+                        ('lat', np.float64), ('lon', np.float64)])
+
+
+def shard_name(number):
+    return f"shard_{number:05d}.bin"
+
+
+def labels_hash(rows):
+    """Hash of the (file, lat, lon) rows alone, checkable without the loose images."""
+    digest = hashlib.sha256()
+    for file_name, lat, lon in rows:
+        digest.update(f"{file_name}\t{lat!r}\t{lon!r}\n".encode('utf-8'))
+    return digest.hexdigest()
+
+
+def pack_shards(csv_file, root_dir, output_dir, shard_size_mb=256, workers=8):
+    """
+    Pack the images listed in csv_file into shard files of about shard_size_mb,
+    the encoded bytes unchanged, one after the other. index.npy gives the shard,
+    offset, length, lat and lon of every frame and names.npy its file name.
+    """
+    with open(csv_file, 'r') as f:
+        rows = [(row['file_name'], float(row['lat']), float(row['lon'])) for row in csv.DictReader(f)]
+
+    tmp_dir = output_dir.rstrip('/\\') + '.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    index = np.zeros(len(rows), dtype=INDEX_DTYPE)
+    shard_limit = shard_size_mb * 1024 * 1024
+    shard, offset, shard_file = 0, 0, open(os.path.join(tmp_dir, shard_name(0)), 'wb')
+
+    def read(row):
+        with open(os.path.join(root_dir, row[0]), 'rb') as image_file:
+            return image_file.read()
+
+    def append(position, row, data):
+        nonlocal shard, offset, shard_file
+        if offset > 0 and offset + len(data) > shard_limit:
+            shard_file.close()
+            shard, offset = shard + 1, 0
+            shard_file = open(os.path.join(tmp_dir, shard_name(shard)), 'wb')
+        shard_file.write(data)
+        index[position] = (shard, offset, len(data), row[1], row[2])
+        offset += len(data)
+
+    try:
+        # Threads read the next files while the current one is appended, at most
+        # workers * 4 files ahead so memory stays bounded whatever the dataset size.
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            pending = deque()
+            for position, row in enumerate(rows):
+                pending.append((position, row, executor.submit(read, row)))
+                if len(pending) >= workers * 4:
+                    position, row, future = pending.popleft()
+                    append(position, row, future.result())
+            while pending:
+                position, row, future = pending.popleft()
+                append(position, row, future.result())
+    finally:
+        shard_file.close()
+
+    np.save(os.path.join(tmp_dir, 'index.npy'), index)
+    np.save(os.path.join(tmp_dir, 'names.npy'), np.array([row[0] for row in rows], dtype=str))
+    with open(os.path.join(tmp_dir, 'meta.json'), 'w') as f:
+        json.dump({'samples': len(rows), 'shards': shard + 1,
+                   'manifest': manifest_hash(rows, root_dir), 'labels': labels_hash(rows)}, f)
+
+    # Only a complete pack gets the final name.
+    shutil.rmtree(output_dir, ignore_errors=True)
+    os.replace(tmp_dir, output_dir)
+    return output_dir
+
+
+def is_up_to_date(csv_file, root_dir, shard_dir, check_images=True):
+    """
+    Whether shard_dir was packed from the rows of csv_file, in the same order,
+    and (check_images) from the images of root_dir as they are now.
+    """
+    path = os.path.join(shard_dir, 'meta.json')
+    if not os.path.exists(path):
+        return False
+    with open(path, 'r') as f:
+        meta = json.load(f)
+    with open(csv_file, 'r') as f:
+        rows = [(row['file_name'], float(row['lat']), float(row['lon'])) for row in csv.DictReader(f)]
+    if meta.get('labels') != labels_hash(rows):
+        return False
+    if not check_images:
+        return True
+    try:
+        return meta['manifest'] == manifest_hash(rows, root_dir)
+    except FileNotFoundError:
+        return False
+
+
+class ShardDataset(Dataset):
+    """
+    MyDataset over packed shards: same (image, normalized lat/lon) samples,
+    read with random access from memory-mapped shard files instead of one
+    open() per frame. transform and roi as in MyDataset.
+    """
+
+    def __init__(self, shard_dir, transform=None, roi=None):
+        self.shard_dir = shard_dir
+        self.transform = transform
+        self.roi = roi
+        self.index = np.load(os.path.join(shard_dir, 'index.npy'), mmap_mode='r')
+        self.names = np.load(os.path.join(shard_dir, 'names.npy'), mmap_mode='r')
+        with open(os.path.join(shard_dir, 'meta.json'), 'r') as f:
+            self.num_shards = json.load(f)['shards']
+        self._maps = {}
+        self._samples = None
+
+    def __getstate__(self):
+        # DataLoader workers open their own mappings (and rebuild samples if they need them).
+        return {**self.__dict__, '_maps': {}, '_samples': None}
+
+    @property
+    def samples(self):
+        # Built once on first use, callers index it in loops.
+        if self._samples is None:
+            lat = (self.index['lat'] - 47.39) * 1000.0
+            lon = (self.index['lon'] + 1.18) * 1000.0
+            self._samples = list(zip(self.names.tolist(), lat.tolist(), lon.tolist()))
+        return self._samples
+
+    def shard_map(self, shard):
+        data = self._maps.get(shard)
+        if data is None:
+            data = np.memmap(os.path.join(self.shard_dir, shard_name(shard)), dtype=np.uint8, mode='r')
+            self._maps[shard] = data
+        return data
+
+    def decode(self, data, entry):
+        image = Image.open(io.BytesIO(data)).convert('RGB')
+        if self.roi is not None:
+            image = RoiCrop(self.roi)(image)
+        if self.transform:
+            image = self.transform(image)
+        labels = torch.tensor([(entry['lat'] - 47.39) * 1000.0, (entry['lon'] + 1.18) * 1000.0],
+                              dtype=torch.float)
+        return image, labels
+
+    def __len__(self):
+        return len(self.index)
+
+    def __getitem__(self, idx):
+        entry = self.index[idx]
+        offset = int(entry['offset'])
+        return self.decode(self.shard_map(int(entry['shard']))[offset:offset + int(entry['length'])], entry)
+
+
+class ShardStream(IterableDataset):
+    """
+    Sequential reading of a ShardDataset: every shard is read in one go and
+    its frames are yielded in order. DataLoader workers each take every
+    num_workers-th shard; shuffle_shards changes the shard order every epoch.
+    """
+
+    def __init__(self, dataset, shuffle_shards=False, seed=0):
+        self.dataset = dataset
+        self.shuffle_shards = shuffle_shards
+        self.seed = seed
+        self.epoch = 0
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def __len__(self):
+        return len(self.dataset)
+
+    def __iter__(self):
+        shards = list(range(self.dataset.num_shards))
+        if self.shuffle_shards:
+            random.Random(self.seed + self.epoch).shuffle(shards)
+        worker = get_worker_info()
+        if worker is not None:
+            shards = shards[worker.id::worker.num_workers]
+
+        shard_column = np.asarray(self.dataset.index['shard'])
+        for shard in shards:
+            with open(os.path.join(self.dataset.shard_dir, shard_name(shard)), 'rb') as f:
+                data = f.read()
+            for idx in np.flatnonzero(shard_column == shard):
+                entry = self.dataset.index[idx]
+                offset = int(entry['offset'])
+                yield self.dataset.decode(data[offset:offset + int(entry['length'])], entry)
+
+
+def benchmark(csv_file, root_dir, shard_dir, epochs=1, decode=False, seed=0):
+    """Epoch read time of the loose files, the shards in random order and the shards streamed."""
+    loose = MyDataset(csv_file=csv_file, root_dir=root_dir)
+    shards = ShardDataset(shard_dir)
+    order = list(range(len(shards)))
+    random.Random(seed).shuffle(order)
+
+    def loose_epoch():
+        for idx in order:
+            if decode:
+                yield loose[idx]
+            else:
+                with open(os.path.join(root_dir, loose.samples[idx][0]), 'rb') as f:
+                    yield f.read()
+
+    def shard_epoch():
+        for idx in order:
+            if decode:
+                yield shards[idx]
+            else:
+                entry = shards.index[idx]
+                yield bytes(shards.shard_map(int(entry['shard']))[int(entry['offset']):
+                                                                  int(entry['offset']) + int(entry['length'])])
+
+    def stream_epoch():
+        if decode:
+            yield from ShardStream(shards)
+            return
+        for shard in range(shards.num_shards):
+            with open(os.path.join(shard_dir, shard_name(shard)), 'rb') as f:
+                data = f.read()
+            for entry in shards.index[shards.index['shard'] == shard]:
+                yield data[int(entry['offset']):int(entry['offset']) + int(entry['length'])]
+
+    results = []
+    for name, epoch in (('loose files', loose_epoch), ('shards, random access', shard_epoch),
+                        ('shards, sequential', stream_epoch)):
+        for number in range(epochs):
+            start = time.perf_counter()
+            frames = sum(1 for _ in epoch())
+            elapsed = time.perf_counter() - start
+            results.append({'layout': name, 'epoch': number + 1, 'time_s': elapsed,
+                            'images_per_s': frames / elapsed if elapsed > 0 else None})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Pack the dataset images and labels into large shard files.')
+    parser.add_argument('--csv', type=str, default='dataset.csv',
+                        help='CSV file with the labels.')
+    parser.add_argument('--root', type=str, default='./resizeDataSet',
+                        help='Folder containing the images.')
+    parser.add_argument('--output', type=str, default='shards',
+                        help='Folder of the shard files and their index.')
+    parser.add_argument('--shard-size', type=int, default=256,
+                        help='Approximate size of a shard in MB.')
+    parser.add_argument('--workers', type=int, default=8,
+                        help='Threads reading the images while packing.')
+    parser.add_argument('--force', action='store_true',
+                        help='Pack again even if the shards match the dataset.')
+    parser.add_argument('--benchmark', action='store_true',
+                        help='Then compare the epoch read time of the loose files and the shards.')
+    parser.add_argument('--epochs', type=int, default=2,
+                        help='Epochs read by the benchmark (the later ones run with a warm page cache).')
+    parser.add_argument('--decode', action='store_true',
+                        help='Benchmark: also decode the images (default: only read their bytes).')
+    args = parser.parse_args()
+
+    if not args.force and is_up_to_date(args.csv, args.root, args.output):
+        print(f"{args.output} is up to date")
+    else:
+        start = time.perf_counter()
+        pack_shards(args.csv, args.root, args.output, args.shard_size, args.workers)
+        with open(os.path.join(args.output, 'meta.json'), 'r') as f:
+            meta = json.load(f)
+        print(f"{meta['samples']} frames packed into {meta['shards']} shards in {args.output} "
+              f"in {time.perf_counter() - start:.2f} s")
+
+    if args.benchmark:
+        # Drop the page cache first (e.g. echo 3 > /proc/sys/vm/drop_caches) to see the cold-cache case.
+        for result in benchmark(args.csv, args.root, args.output, args.epochs, args.decode):
+            print(f"{result['layout']:<22} epoch {result['epoch']}: {result['time_s']:.2f} s "
+                  f"({result['images_per_s']:.1f} images/s)")
+
+
+if __name__ == '__main__':
+    main()
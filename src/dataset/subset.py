@@ -0,0 +1,209 @@
+import argparse
+import csv
+import errno
+import json
+import os
+import random
+import re
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from src.dataset.labels import IMAGE_EXTENSIONS, find_parts, natural_key
+
+FRAME_PATTERN = re.compile(r"frame_(\d+)\.")
+SUBSET_SUFFIX = '.subset.json'
+
+
+def frame_number(file_name):
+    match = FRAME_PATTERN.search(os.path.basename(file_name))
+    return int(match.group(1)) if match else None
+
+
+def list_frames(root_dir, parts=None, csv_file=None, workers=8):
+    """
+    Candidate frames as paths relative to root_dir: the rows of csv_file when
+    given (no directory listing at all), else the images of every part
+    (or of the given part names), listed in parallel.
+    """
+    if csv_file is not None:
+        with open(csv_file, 'r') as f:
+            names = [row['file_name'] for row in csv.DictReader(f)]
+        if parts:
+            parts = set(parts)
+            names = [name for name in names if name.split('/', 1)[0] in parts]
+        return names
+
+    part_dirs = [os.path.join(root_dir, part) for part in parts] if parts else find_parts(root_dir)
+
+    def list_part(part_dir):
+        prefix = os.path.relpath(part_dir, root_dir).replace(os.sep, '/')
+        with os.scandir(part_dir) as entries:
+            files = [entry.name for entry in entries
+                     if entry.is_file() and entry.name.lower().endswith(IMAGE_EXTENSIONS)]
+        return [f"{prefix}/{name}" for name in sorted(files, key=natural_key)]
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return [name for names in executor.map(list_part, part_dirs) for name in names]
+
+
+def select_frames(names, start=None, end=None, step=1, start_time=None, end_time=None, fps=None,
+                  fraction=None, seed=0):
+    """
+    Keep the frames whose number (frame_<n>.png) is in [start, end] with
+    (n - start) % step == 0, whose time n / fps is in [start_time, end_time],
+    then a random fraction of them.
+    """
+    if (start_time is not None or end_time is not None) and not fps:
+        raise ValueError("A time range needs the frame rate (fps)")
+
+    selected = []
+    for name in names:
+        number = frame_number(name)
+        if number is None:
+            continue
+        if (start is not None and number < start) or (end is not None and number > end):
+            continue
+        if step > 1 and (number - (start or 0)) % step != 0:
+            continue
+        if start_time is not None or end_time is not None:
+            seconds = number / fps
+            if (start_time is not None and seconds < start_time) or (end_time is not None and seconds > end_time):
+                continue
+        selected.append(name)
+
+    if fraction is not None and fraction < 1.0:
+        keep = set(random.Random(seed).sample(range(len(selected)), int(round(fraction * len(selected)))))
+        selected = [name for position, name in enumerate(selected) if position in keep]
+    return selected
+
+
+def write_subset(path, root_dir, files, spec):
+    """
+    Subset manifest: the dataset root (relative to the manifest), the spec it
+    was made with and the selected files relative to the root.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump({'root': os.path.relpath(os.path.abspath(root_dir), directory).replace(os.sep, '/'),
+                   'spec': spec, 'files': files}, f, indent=1)
+    os.replace(path + '.tmp', path)
+    return path
+
+
+def is_subset(source):
+    return isinstance(source, str) and source.endswith(SUBSET_SUFFIX) and os.path.isfile(source)
+
+
+def read_subset(path):
+    """(absolute root, files relative to it) of a subset manifest."""
+    with open(path, 'r', encoding='utf-8') as f:
+        subset = json.load(f)
+    root = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(path)), subset['root']))
+    return root, subset['files']
+
+
+def subset_paths(path):
+    root, files = read_subset(path)
+    return [os.path.join(root, name) for name in files]
+
+
+def link_file(source, destination, mode='hardlink'):
+    # Hard links fall back to symlinks across file systems.
+    if os.path.lexists(destination):
+        return 'skipped'
+    if mode == 'hardlink':
+        try:
+            os.link(source, destination)
+            return 'hardlink'
+        except OSError as e:
+            if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+                raise
+            mode = 'symlink'
+    if mode == 'symlink':
+        os.symlink(os.path.abspath(source), destination)
+        return 'symlink'
+    shutil.copy2(source, destination)
+    return 'copy'
+
+
+def materialize(subset_path, dest_dir, mode='hardlink', flatten=False, workers=16):
+    """
+    Make a real directory of a subset with hard links (or symlinks, or copies)
+    in parallel. flatten puts every file directly in dest_dir as <part>_<name>,
+    otherwise the relative paths are kept. Returns the count of each link type.
+    """
+    root, files = read_subset(subset_path)
+    targets = [name.replace('/', '_') if flatten else name for name in files]
+    for directory in {os.path.dirname(os.path.join(dest_dir, target)) for target in targets}:
+        os.makedirs(directory, exist_ok=True)
+
+    counts = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for kind in executor.map(lambda pair: link_file(os.path.join(root, pair[0]), os.path.join(dest_dir, pair[1]),
+                                                        mode), zip(files, targets)):
+            counts[kind] = counts.get(kind, 0) + 1
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Make a subset manifest of the dataset frames (no copy), '
+                                                 'optionally materialized with hard links.')
+    parser.add_argument('--root', type=str, default=os.getenv('DATASET_PATH') or '.',
+                        help='Folder containing the partXXX directories (default: $DATASET_PATH).')
+    parser.add_argument('--parts', type=str, nargs='*', default=None,
+                        help='Part directories to use (default: every partXXX).')
+    parser.add_argument('--csv', type=str, default=None,
+                        help='Take the candidate frames from this label CSV (names relative to --root) '
+                             'instead of listing the parts.')
+    parser.add_argument('--start', type=int, default=None,
+                        help='First frame number (included).')
+    parser.add_argument('--end', type=int, default=None,
+                        help='Last frame number (included).')
+    parser.add_argument('--step', type=int, default=1,
+                        help='Keep one frame every step frames.')
+    parser.add_argument('--start-time', type=float, default=None,
+                        help='Start of the time range in seconds (needs --fps).')
+    parser.add_argument('--end-time', type=float, default=None,
+                        help='End of the time range in seconds (needs --fps).')
+    parser.add_argument('--fps', type=float, default=None,
+                        help='Frame rate of the recordings, frame_<n> is at n / fps seconds.')
+    parser.add_argument('--fraction', type=float, default=None,
+                        help='Random fraction of the selected frames to keep.')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', type=str, required=True,
+                        help=f"Subset manifest to write (*{SUBSET_SUFFIX}).")
+    parser.add_argument('--materialize', type=str, default=None,
+                        help='Also create this directory with links to the selected frames.')
+    parser.add_argument('--link', type=str, default='hardlink', choices=['hardlink', 'symlink', 'copy'],
+                        help='How the materialized files point to the originals.')
+    parser.add_argument('--flatten', action='store_true',
+                        help='Materialize every file directly in the directory as <part>_<file>.')
+    args = parser.parse_args()
+
+    if not args.output.endswith(SUBSET_SUFFIX):
+        parser.error(f"--output must end with {SUBSET_SUFFIX}")
+    if args.fraction is not None and not 0.0 < args.fraction <= 1.0:
+        parser.error('--fraction must be in (0, 1]')
+    if (args.start_time is not None or args.end_time is not None) and not args.fps:
+        parser.error('--start-time/--end-time need --fps')
+
+    start = time.perf_counter()
+    names = list_frames(args.root, args.parts, args.csv)
+    files = select_frames(names, args.start, args.end, args.step, args.start_time, args.end_time, args.fps,
+                          args.fraction, args.seed)
+    spec = {key: getattr(args, key) for key in ('parts', 'csv', 'start', 'end', 'step', 'start_time', 'end_time',
+                                                'fps', 'fraction', 'seed')}
+    write_subset(args.output, args.root, files, spec)
+    print(f"{len(files)} of {len(names)} frames written to {args.output} in {time.perf_counter() - start:.2f} s")
+
+    if args.materialize is not None:
+        start = time.perf_counter()
+        counts = materialize(args.output, args.materialize, args.link, args.flatten)
+        print(f"{args.materialize} materialized in {time.perf_counter() - start:.2f} s: "
+              + ', '.join(f"{count} {kind}" for kind, count in sorted(counts.items())))
+
+
+if __name__ == '__main__':
+    main()
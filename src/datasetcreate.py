@@ -1,41 +1,46 @@
 import os
-import shutil
-import re
 from dotenv import load_dotenv
+
+from src.dataset.subset import list_frames, materialize, select_frames, write_subset
+
 load_dotenv()
 DATASET_PATH = os.getenv('DATASET_PATH')
 
-def copy_images_by_interval(source_dirs, dest_dir, start, end, step):
+def copy_images_by_interval(source_dirs, dest_dir, start, end, step, manifest_path=None):
     """
-    Copie les images des dossiers sources dans un dossier de destination en respectant un intervalle.
+    Crée le sous-ensemble des images des dossiers sources qui respectent un intervalle.
+
+    Le sous-ensemble est d'abord écrit comme manifeste (`*.subset.json`, aucune copie), utilisable
+    directement par MyDataset, Img2Vec et `infer --folder`. Le dossier de destination est ensuite
+    rempli de liens physiques (liens symboliques entre disques différents), en parallèle.
 
     :param source_dirs: Liste des chemins des dossiers sources.
     :param dest_dir: Chemin du dossier de destination.
     :param start: Numéro de début de l'intervalle (inclus).
     :param end: Numéro de fin de l'intervalle (inclus).
     :param step: Pas de l'intervalle.
+    :param manifest_path: Chemin du manifeste (par défaut à côté du dossier de destination).
+    :return: Chemin du manifeste.
     """
-    # Créer le dossier de destination s'il n'existe pas
-    os.makedirs(dest_dir, exist_ok=True)
-
-    # Construire le pattern regex pour les fichiers d'images
-    pattern = re.compile(r"frame_(\d+)\.png")
-
+    existing = [source_dir for source_dir in source_dirs if os.path.isdir(source_dir)]
     for source_dir in source_dirs:
-        if not os.path.isdir(source_dir):
+        if source_dir not in existing:
             print(f"Le dossier source {source_dir} n'existe pas. Ignoré.")
-            continue
-
-        for filename in os.listdir(source_dir):
-            match = pattern.match(filename)
-            if match:
-                frame_number = int(match.group(1))
-                # Vérifier si le numéro de l'image est dans l'intervalle souhaité
-                if start <= frame_number <= end and (frame_number - start) % step == 0:
-                    src_path = os.path.join(source_dir, filename)
-                    dest_path = os.path.join(dest_dir, filename)
-                    shutil.copy(src_path, dest_path)
-                    print(f"Copié: {src_path} -> {dest_path}")
+    if not existing:
+        raise ValueError("Aucun dossier source n'existe.")
+
+    # Les chemins du manifeste sont relatifs au dossier parent commun des parts.
+    root = os.path.commonpath([os.path.abspath(os.path.dirname(source_dir)) for source_dir in existing])
+    parts = [os.path.relpath(os.path.abspath(source_dir), root) for source_dir in existing]
+    files = select_frames(list_frames(root, parts), start, end, step)
+
+    manifest_path = manifest_path or dest_dir.rstrip('/\\') + '.subset.json'
+    write_subset(manifest_path, root, files, {'parts': parts, 'start': start, 'end': end, 'step': step})
+    # Un seul dossier à plat comme avant, nommé <part>_<image> pour éviter les collisions entre parts.
+    counts = materialize(manifest_path, dest_dir, flatten=True)
+    print(f"{len(files)} images sélectionnées ({manifest_path}), {dest_dir} : "
+          + ', '.join(f"{count} {kind}" for kind, count in sorted(counts.items())))
+    return manifest_path
 
 if __name__ == "__main__":
     source_dirs = [f"{DATASET_PATH}/part000",
@@ -1,103 +1,285 @@
+import argparse
+import json
 import os
+import random
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
 from PIL import Image
-from concurrent.futures import ThreadPoolExecutor
+
+# Format de sortie -> (extension, format PIL). Le PNG est sans perte : la qualité n'y change rien.
+FORMATS = {
+    'webp': ('.webp', 'WEBP'),
+    'jpeg': ('.jpg', 'JPEG'),
+    'png': ('.png', 'PNG'),
+}
+
+PART_PATTERN = re.compile(r"part\d+$", re.IGNORECASE)
+
+# Réglages (qualité, taille) des images d'un dossier compressé, un fichier par format.
+SETTINGS_FILE = 'compression_{}.json'
+
+
+def compress_file(input_path, output_path, target_size, image_format, quality):
+    """
+    Redimensionne et compresse une image (fonction de module pour le pool de processus).
+
+    :return: (octets en entrée, octets en sortie, erreur ou None).
+    """
+    _, pil_format = FORMATS[image_format]
+    tmp_path = output_path + '.tmp'
+    try:
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        with Image.open(input_path) as img:
+            img.thumbnail(target_size)
+            if pil_format == 'JPEG' and img.mode != 'RGB':
+                img = img.convert('RGB')
+            options = {'optimize': True}
+            if pil_format != 'PNG':
+                options['quality'] = quality
+            if pil_format == 'WEBP':
+                options['method'] = 6
+            img.save(tmp_path, format=pil_format, **options)
+        os.replace(tmp_path, output_path)
+        return os.path.getsize(input_path), os.path.getsize(output_path), None
+    except Exception as e:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return os.path.getsize(input_path) if os.path.exists(input_path) else 0, 0, f"{type(e).__name__}: {e}"
 
 
 class ImageCompressor:
-    def __init__(self, base_directory, quality=85, target_size=(224, 224)):
+    def __init__(self, base_directory, quality=85, target_size=(224, 224), image_format='webp', workers=None):
         """
         Initialise le compresseur d'images.
 
         :param base_directory: Répertoire de base contenant les sous-dossiers à traiter.
-        :param quality: Qualité de compression (entre 1 et 100).
+        :param quality: Qualité de compression (entre 1 et 100, pour WebP et JPEG).
         :param target_size: Taille maximale pour le redimensionnement des images (largeur, hauteur).
+        :param image_format: Format de sortie (webp, jpeg ou png).
+        :param workers: Nombre de processus (par défaut un par CPU).
         """
+        if image_format not in FORMATS:
+            raise ValueError(f"Format inconnu : {image_format}")
         self.base_directory = base_directory
         self.quality = quality
         self.target_size = target_size
+        self.image_format = image_format
+        self.workers = workers
 
-    def resize_image(self, img):
+    def output_name(self, relative_path):
         """
-        Redimensionne une image selon la taille cible.
-
-        :param img: Instance PIL.Image.
-        :return: Image redimensionnée.
+        Chemin relatif de l'image compressée : part000/frame_1.png -> Compressed_part000/frame_1.webp.
         """
-        img.thumbnail(self.target_size)
-        return img
+        folder, _, rest = relative_path.replace(os.sep, '/').partition('/')
+        return f"Compressed_{folder}/{os.path.splitext(rest)[0]}{FORMATS[self.image_format][0]}"
 
-    def compress_image(self, img, output_path):
-        """
-        Compresse une image et la sauvegarde dans le chemin spécifié.
+    def settings(self):
+        return {'format': self.image_format, 'quality': None if self.image_format == 'png' else self.quality,
+                'size': list(self.target_size)}
 
-        :param img: Instance PIL.Image.
-        :param output_path: Chemin de l'image de sortie.
-        """
-        os.makedirs(os.path.dirname(output_path), exist_ok=True)
-        img.save(output_path, optimize=True, quality=self.quality)
+    def settings_path(self, folder):
+        return os.path.join(self.base_directory, f"Compressed_{folder}", SETTINGS_FILE.format(self.image_format))
 
-    def process_image(self, input_path, output_path):
-        """
-        Redimensionne et compresse une image PNG.
+    def read_settings(self, folder):
+        try:
+            with open(self.settings_path(folder), 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
 
-        :param input_path: Chemin de l'image source.
-        :param output_path: Chemin de l'image de sortie.
+    def find_folders(self):
         """
-        try:
-            with Image.open(input_path) as img:
-                img = self.resize_image(img)  # Redimensionner
-                self.compress_image(img, output_path)  # Compresser
-                print(f"Image traitée : {output_path}")
-        except Exception as e:
-            print(f"Erreur pour {input_path} : {e}")
-
-    def process_folder(self, input_folder, output_folder):
+        Sous-dossiers "PartXXX" (ou "partXXX") du répertoire de base.
+        """
+        return sorted(entry.name for entry in os.scandir(self.base_directory)
+                      if entry.is_dir() and PART_PATTERN.match(entry.name))
+
+    def list_tasks(self, folders, forced=()):
         """
-        Traite un dossier en compressant et redimensionnant toutes les images PNG.
+        Images à compresser, en sautant celles dont la sortie est plus récente que la source
+        (sauf dans les dossiers de `forced`, compressés avec d'autres réglages).
 
-        :param input_folder: Chemin du dossier source.
-        :param output_folder: Chemin du dossier de sortie.
+        :return: (liste de (source, sortie), octets en entrée et en sortie des images déjà compressées, nombre sautées).
         """
-        for root, _, files in os.walk(input_folder):
-            for file in files:
-                if file.endswith(".png"):
+        tasks = []
+        skipped_in, skipped_out, skipped = 0, 0, 0
+        for folder in folders:
+            for root, _, files in os.walk(os.path.join(self.base_directory, folder)):
+                for file in files:
+                    if not file.lower().endswith(".png"):
+                        continue
                     input_path = os.path.join(root, file)
-                    output_path = os.path.join(output_folder, os.path.relpath(input_path, input_folder))
-                    self.process_image(input_path, output_path)
+                    relative_path = os.path.relpath(input_path, self.base_directory)
+                    output_path = os.path.join(self.base_directory, self.output_name(relative_path))
+                    input_stat = os.stat(input_path)
+                    if folder in forced:
+                        tasks.append((input_path, output_path))
+                        continue
+                    try:
+                        output_stat = os.stat(output_path)
+                        if output_stat.st_mtime_ns >= input_stat.st_mtime_ns:
+                            skipped_in += input_stat.st_size
+                            skipped_out += output_stat.st_size
+                            skipped += 1
+                            continue
+                    except FileNotFoundError:
+                        pass
+                    tasks.append((input_path, output_path))
+        return tasks, skipped_in, skipped_out, skipped
 
     def process_all_folders(self):
         """
-        Traite tous les sous-dossiers "PartXXX" du répertoire de base.
-        """
-        folders = [
-            (os.path.join(self.base_directory, f"Part{i:03d}"),
-             os.path.join(self.base_directory, f"Compressed_Part{i:03d}"))
-            for i in range(15)
-            if os.path.exists(os.path.join(self.base_directory, f"Part{i:03d}"))
-        ]
+        Traite toutes les images des sous-dossiers "PartXXX" avec un pool de processus (une tâche par image).
 
+        :return: Rapport (nombre d'images, octets en entrée/sortie, durée, erreurs).
+        """
+        folders = self.find_folders()
         if not folders:
             print("Aucun dossier valide trouvé. Vérifiez le chemin.")
-            return
+            return None
+
+        start = time.perf_counter()
+        # Les images d'un dossier compressé avec une autre qualité ou taille sont toutes refaites.
+        forced = {folder for folder in folders if self.read_settings(folder) != self.settings()}
+        for folder in forced:
+            if os.path.exists(self.settings_path(folder)):
+                os.remove(self.settings_path(folder))
+        tasks, bytes_in, bytes_out, skipped = self.list_tasks(folders, forced)
+        print(f"{len(folders)} dossiers trouvés, {len(tasks)} images à compresser ({skipped} déjà compressées).")
+
+        failures = []
+        if tasks:
+            inputs = [input_path for input_path, _ in tasks]
+            outputs = [output_path for _, output_path in tasks]
+            with ProcessPoolExecutor(max_workers=self.workers) as executor:
+                results = executor.map(compress_file, inputs, outputs, repeat(self.target_size),
+                                       repeat(self.image_format), repeat(self.quality), chunksize=32)
+                for input_path, (size_in, size_out, error) in zip(inputs, results):
+                    if error is not None:
+                        failures.append((input_path, error))
+                        print(f"Erreur pour {input_path} : {error}")
+                        continue
+                    bytes_in += size_in
+                    bytes_out += size_out
+
+        # Réglages écrits seulement pour les dossiers entièrement compressés.
+        failed = {os.path.relpath(input_path, self.base_directory).split(os.sep)[0] for input_path, _ in failures}
+        for folder in folders:
+            if folder not in failed:
+                os.makedirs(os.path.dirname(self.settings_path(folder)), exist_ok=True)
+                with open(self.settings_path(folder), 'w') as f:
+                    json.dump(self.settings(), f)
+
+        report = {
+            'compressed': len(tasks) - len(failures),
+            'skipped': skipped,
+            'failures': failures,
+            'bytes_in': bytes_in,
+            'bytes_out': bytes_out,
+            'time_s': time.perf_counter() - start,
+        }
+        print_report(report)
+        return report
+
+    def evaluate_impact(self, model_path, csv_file, samples=None, batch_size=8, seed=0):
+        """
+        Erreur (en mètres) d'un modèle ONNX sur les images d'origine et sur les images compressées.
+
+        :param csv_file: CSV des labels, noms de fichiers relatifs au répertoire de base (src.dataset.labels).
+        :param samples: Nombre d'images tirées au hasard pour l'évaluation (par défaut toutes).
+        :return: Lignes du tableau (original, compressé).
+        """
+        # torch et onnxruntime ne sont nécessaires que pour cette évaluation.
+        from torch.utils.data import Subset
 
-        print(f"{len(folders)} dossiers trouvés. Compression en cours...")
-        with ThreadPoolExecutor() as executor:
-            futures = [
-                executor.submit(self.process_folder, input_folder, output_folder)
-                for input_folder, output_folder in folders
-            ]
+        from src.dataset.dataset import MyDataset
+        from src.model.engine import InferenceEngine
+        from src.model.evaluate import evaluate_errors, get_transform
+        from src.utils.geo import summarize_errors
 
-        print("Traitement terminé !")
+        # Le tableau est étiqueté avec les réglages courants : ils doivent être ceux des images.
+        stale = [folder for folder in self.find_folders()
+                 if os.path.isdir(os.path.join(self.base_directory, f"Compressed_{folder}"))
+                 and self.read_settings(folder) != self.settings()]
+        if stale:
+            raise ValueError(f"Images de {', '.join(stale)} compressées avec d'autres réglages, "
+                             f"relancez process_all_folders()")
+
+        engine = InferenceEngine(model_path)
+        transform = get_transform(engine.input_size or 380, engine.roi)
+        original = MyDataset(csv_file=csv_file, root_dir=self.base_directory, transform=transform)
+        compressed = MyDataset(csv_file=csv_file, root_dir=self.base_directory, transform=transform)
+        compressed.samples = [(self.output_name(name), lat, lon) for name, lat, lon in compressed.samples]
+
+        indices = [index for index, (name, _, _) in enumerate(compressed.samples)
+                   if os.path.exists(os.path.join(self.base_directory, name))]
+        if samples is not None and samples < len(indices):
+            indices = sorted(random.Random(seed).sample(indices, samples))
+
+        rows = []
+        for name, dataset in (('original', original), (f"{self.image_format} q{self.quality}", compressed)):
+            summary = summarize_errors(evaluate_errors(engine, Subset(dataset, indices), batch_size=batch_size,
+                                                       verbose=False))
+            rows.append({'name': name, 'images': len(indices), **summary})
+        return rows
+
+
+def print_report(report):
+    ratio = report['bytes_in'] / report['bytes_out'] if report['bytes_out'] else 0.0
+    files_per_s = report['compressed'] / report['time_s'] if report['time_s'] > 0 else 0.0
+    print(f"{report['compressed']} images compressées, {report['skipped']} déjà à jour, "
+          f"{len(report['failures'])} erreurs en {report['time_s']:.2f} s ({files_per_s:.1f} fichiers/s)")
+    print(f"Octets : {report['bytes_in'] / 1e6:.1f} Mo -> {report['bytes_out'] / 1e6:.1f} Mo (ratio {ratio:.2f}x)")
+
+
+IMPACT_COLUMNS = [
+    ('name', 'Images', 's'),
+    ('images', 'Count', 'd'),
+    ('mean_m', 'Mean err (m)', '.2f'),
+    ('median_m', 'Median err (m)', '.2f'),
+    ('p95_m', 'P95 err (m)', '.2f'),
+]
 
 
 # Exemple d'utilisation
 def main():
-    base_directory = input("Entrez le chemin du dossier contenant les sous-dossiers Part000 à Part014 : ").strip()
-    quality = int(input("Entrez le niveau de qualité de compression (50-100, recommandé : 85) : ").strip())
-    target_size = (224, 224)  # Taille cible par défaut
+    parser = argparse.ArgumentParser(description='Compresse les images des dossiers PartXXX (WebP/JPEG).')
+    parser.add_argument('--base-directory', type=str, default=None,
+                        help='Dossier contenant les sous-dossiers Part000 à Part014 (demandé si absent).')
+    parser.add_argument('--quality', type=int, default=None,
+                        help='Qualité de compression WebP/JPEG (50-100, recommandé : 85).')
+    parser.add_argument('--format', type=str, default='webp', choices=list(FORMATS),
+                        help='Format de sortie.')
+    parser.add_argument('--size', type=int, default=224,
+                        help='Taille maximale (largeur et hauteur) des images.')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Nombre de processus (par défaut un par CPU).')
+    parser.add_argument('--model', type=str, default=None,
+                        help="Modèle ONNX pour mesurer l'impact de la compression sur l'erreur.")
+    parser.add_argument('--csv', type=str, default='dataset.csv',
+                        help='Labels (noms relatifs au dossier de base) pour --model.')
+    parser.add_argument('--eval-samples', type=int, default=500,
+                        help="Nombre d'images utilisées pour --model.")
+    args = parser.parse_args()
+
+    base_directory = args.base_directory or input(
+        "Entrez le chemin du dossier contenant les sous-dossiers Part000 à Part014 : ").strip()
+    quality = args.quality or int(input(
+        "Entrez le niveau de qualité de compression (50-100, recommandé : 85) : ").strip())
+    target_size = (args.size, args.size)  # Taille cible par défaut
 
     # Initialiser et exécuter le compresseur
-    compressor = ImageCompressor(base_directory, quality, target_size)
+    compressor = ImageCompressor(base_directory, quality, target_size, args.format, args.workers)
     compressor.process_all_folders()
 
+    if args.model is not None:
+        from src.utils.utils import format_table
+        print()
+        print(format_table(compressor.evaluate_impact(args.model, args.csv, args.eval_samples), IMPACT_COLUMNS))
+
 
+if __name__ == '__main__':
+    main()
@@ -14,6 +14,13 @@ import torchvision.transforms as transforms
 from kmeans_pytorch import kmeans
 from PIL import Image
 
+try:
+    from src.dataset.subset import is_subset, subset_paths
+except ImportError:
+    # main_similarity.py imports this module from inside src/
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from src.dataset.subset import is_subset, subset_paths
+
 
 class Img2Vec:
     """
@@ -145,7 +152,9 @@ class Img2Vec:
 
     def validate_source(self, source):
         # convert source format into standard list of file paths
-        if isinstance(source, list):
+        if is_subset(source):
+            source_list = subset_paths(source)
+        elif isinstance(source, list):
             source_list = [f for f in source if os.path.isfile(f)]
         elif os.path.isdir(source):
             source_list = self.directory_to_list(source)
@@ -0,0 +1,180 @@
+import argparse
+import hashlib
+import os
+
+import numpy as np
+import torch
+import torch.nn as nn
+from torch.utils.data import DataLoader, Dataset, Subset
+
+from src.dataset.dataset import MyDataset, manifest_hash
+from src.dataset.loader import add_loader_arguments, loader_options_from_args, make_dataset, make_loader
+from src.model.engine import InferenceEngine, add_engine_arguments, engine_options_from_args
+from src.model.evaluate import get_transform
+from src.model.export import export_split
+from src.model.networks import KartModel, parse_widths
+from src.model.quantize import COMPARISON_COLUMNS, compare_models
+from src.model.train import LOSSES, Trainer, split_dataset, start_emissions_tracker
+from src.utils.chrono import Chrono
+from src.utils.utils import format_table
+
+
+def teacher_cache_path(cache_dir, teacher_path, dataset):
+    # Keyed by the teacher file and the dataset content, like the feature cache.
+    stat = os.stat(teacher_path)
+    teacher = hashlib.sha256(f"{os.path.abspath(teacher_path)}\t{stat.st_size}\t{stat.st_mtime_ns}".encode('utf-8'))
+    manifest = manifest_hash(dataset.samples, dataset.root_dir)
+    return os.path.join(cache_dir, f"teacher_{teacher.hexdigest()[:12]}_{manifest[:16]}.npy")
+
+
+def teacher_predictions(teacher_path, csv_file, root_dir, cache_dir='feature_cache', batch_size=8, num_workers=0,
+                        engine_options=None, subset=None):
+    """
+    Raw (normalized) outputs of the teacher ONNX model for every sample of the
+    dataset, computed once and cached as a .npy file.
+    """
+    engine = InferenceEngine(teacher_path, **(engine_options or {}))
+    dataset = MyDataset(csv_file=csv_file, root_dir=root_dir,
+                        transform=get_transform(engine.input_size or 600, engine.roi), subset=subset)
+    path = teacher_cache_path(cache_dir, teacher_path, dataset)
+    if os.path.exists(path):
+        print(f"Using cached teacher predictions from {path}")
+        return np.load(path)
+
+    print(f"Running the teacher {teacher_path} over {len(dataset)} images")
+    chrono = Chrono()
+    chrono.start()
+    loader = DataLoader(dataset, batch_size=batch_size, shuffle=False, num_workers=num_workers)
+    # Copy: with io_binding the engine reuses its output buffer.
+    outputs = np.concatenate([np.array(engine.run(images.numpy())) for images, _ in loader]).astype(np.float32)
+    print(f"Teacher predictions computed in {chrono.stop():.2f} seconds")
+
+    os.makedirs(cache_dir, exist_ok=True)
+    np.save(path + '.tmp.npy', outputs)
+    os.replace(path + '.tmp.npy', path)
+    return outputs
+
+
+class DistillationDataset(Dataset):
+    """Wraps a dataset so the target is [lat, lon, teacher_lat, teacher_lon]."""
+
+    def __init__(self, dataset, teacher_outputs):
+        if len(dataset) != len(teacher_outputs):
+            raise ValueError(f"{len(teacher_outputs)} teacher predictions for {len(dataset)} samples")
+        self.dataset = dataset
+        self.teacher_outputs = torch.from_numpy(np.asarray(teacher_outputs, dtype=np.float32))
+
+    def __len__(self):
+        return len(self.dataset)
+
+    def __getitem__(self, idx):
+        image, labels = self.dataset[idx]
+        return image, torch.cat([labels, self.teacher_outputs[idx]])
+
+
+class DistillationLoss(nn.Module):
+    """alpha * loss(student, teacher) + (1 - alpha) * loss(student, ground truth)."""
+
+    def __init__(self, alpha=0.5, loss='l1'):
+        super(DistillationLoss, self).__init__()
+        self.alpha = alpha
+        self.criterion = LOSSES[loss]()
+
+    def forward(self, outputs, targets):
+        labels, teacher = targets[:, :2], targets[:, 2:]
+        return (self.alpha * self.criterion(outputs, teacher)
+                + (1.0 - self.alpha) * self.criterion(outputs, labels))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Distill a large teacher ONNX model into a small fast student.')
+    parser.add_argument('--teacher', type=str, default='kart_efficientB7.onnx',
+                        help='Teacher ONNX model (the exported KartEfficientB7).')
+    parser.add_argument('--student', type=str, default='mobilenet_v3_large',
+                        help='torchvision backbone of the student (e.g. mobilenet_v3_large, efficientnet_b0).')
+    parser.add_argument('--input-size', type=int, default=224,
+                        help='Student input resolution.')
+    parser.add_argument('--head-widths', type=parse_widths, default=(256, 64),
+                        help='Comma separated hidden layer widths of the student head.')
+    parser.add_argument('--no-pretrained', dest='pretrained', action='store_false',
+                        help='Start the student from random backbone weights.')
+    parser.add_argument('--finetune', action='store_true',
+                        help='Also train the student backbone (by default only its head is trained).')
+    parser.add_argument('--alpha', type=float, default=0.5,
+                        help='Weight of the teacher targets in the loss (1 - alpha for the GPS labels).')
+    parser.add_argument('--loss', type=str, default='l1', choices=list(LOSSES))
+    parser.add_argument('--csv', type=str, default='dataset.csv',
+                        help='CSV file with the labels.')
+    parser.add_argument('--root', type=str, default='./resizeDataSet',
+                        help='Folder containing the images.')
+    parser.add_argument('--cache-dir', type=str, default='feature_cache',
+                        help='Folder where the teacher predictions are cached.')
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--lr', type=float, default=1e-3)
+    parser.add_argument('--epochs', type=int, default=50)
+    parser.add_argument('--patience', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--latency-runs', type=int, default=20,
+                        help='Number of timed runs for the latency comparison.')
+    parser.add_argument('--output-prefix', type=str, default=None,
+                        help='Prefix of the exported ONNX files (default: kart_student_<backbone>_<size>).')
+    parser.add_argument('--no-emissions', dest='emissions', action='store_false',
+                        help='Do not measure energy with codecarbon.')
+    add_loader_arguments(parser)
+    add_engine_arguments(parser)
+    args = parser.parse_args()
+
+    if not 0.0 <= args.alpha <= 1.0:
+        parser.error('--alpha must be between 0 and 1')
+    output_prefix = args.output_prefix or f"kart_student_{args.student}_{args.input_size}"
+    engine_options = engine_options_from_args(args)
+
+    teacher = teacher_predictions(args.teacher, args.csv, args.root, args.cache_dir, engine_options=engine_options,
+                                  subset=args.subset)
+
+    tracker = start_emissions_tracker() if args.emissions else None
+    torch.manual_seed(args.seed)
+
+    images = make_dataset(args.csv, args.root, args.input_size, args.image_cache, args.roi, args.shards,
+                          args.subset, args.image_cache_dir)
+    dataset = DistillationDataset(images, teacher)
+    train_dataset, val_dataset = split_dataset(dataset, 0.3, args.seed)
+    train_loader = make_loader(train_dataset, args.batch_size, shuffle=True,
+                               generator=torch.Generator().manual_seed(args.seed), **loader_options_from_args(args))
+    val_loader = make_loader(val_dataset, args.batch_size, shuffle=False, **loader_options_from_args(args))
+
+    model = KartModel(args.student, args.head_widths, pretrained=args.pretrained)
+    if args.finetune:
+        for param in model.backbone.parameters():
+            param.requires_grad = True
+    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+
+    trainer = Trainer(model, model if args.finetune else model.classifier, train_loader, val_loader,
+                      DistillationLoss(args.alpha, args.loss), args.lr, device)
+    best_val_loss = trainer.fit(args.epochs, args.patience)
+    print(f"Best val_loss = {best_val_loss:.4f}")
+
+    if tracker is not None:
+        tracker.stop()
+
+    exported = export_split(model, args.input_size, output_prefix, device, args.roi)
+    for part, path in exported.items():
+        print(f"Model ({part}) has been exported to {path}")
+
+    # Accuracy vs latency on the validation images, each model at its own resolution.
+    rows = []
+    for name, path in [('teacher', args.teacher), ('student', exported['combined'])]:
+        engine = InferenceEngine(path)
+        size = engine.input_size
+        images = MyDataset(csv_file=args.csv, root_dir=args.root, transform=get_transform(size, engine.roi),
+                           subset=args.subset)
+        evaluation = Subset(images, sorted(val_dataset.indices))
+        rows += compare_models([(f"{name} ({size}px)", path)], evaluation, engine_options,
+                               batch_size=8, latency_runs=args.latency_runs)
+
+    print()
+    print(format_table(rows, COMPARISON_COLUMNS))
+
+
+if __name__ == '__main__':
+    main()
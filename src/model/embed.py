@@ -0,0 +1,69 @@
+import argparse
+
+import numpy as np
+
+from src.model.engine import add_engine_arguments, engine_from_args
+from src.model.infer import get_transform, load_image, run_inference
+from src.model.pipeline import PrefetchPipeline, StageTimer
+from src.utils.chrono import Chrono
+from src.utils.utils import validate_source
+
+
+def save_features(path, files, features):
+    np.savez(path, files=np.array(files), features=features)
+
+
+def load_features(path):
+    data = np.load(path)
+    return list(data['files']), data['features']
+
+
+def embed_files(engine, files, batch_size=32, workers=4, queue_depth=64, timer=None):
+    """Run the backbone ONNX model over image files, returns a (len(files), feature_size) array."""
+    transform = get_transform(engine.input_size or 380, engine.roi)
+    pipeline = PrefetchPipeline(lambda file: load_image(file, transform), np.concatenate,
+                                workers=workers, queue_depth=queue_depth, timer=timer,
+                                batch_buffer=engine.input_buffer)
+    chrono = Chrono()
+
+    features = []
+    for batch_files, input_data in pipeline.batches(files, batch_size):
+        chrono.start()
+        # Copy: with --io-binding the output buffer is reused by the next run.
+        features.append(np.array(run_inference(engine, input_data)))
+        pipeline.timer.add('inference', chrono.stop(), len(batch_files))
+
+    return np.concatenate(features).astype(np.float32)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compute backbone feature vectors once and store them for reuse.')
+    parser.add_argument('--model', type=str, default='kart_efficientb4_backbone.onnx',
+                        help='Path to the backbone ONNX model file.')
+    parser.add_argument('--folder', type=str, required=True,
+                        help='Path to the folder of images.')
+    parser.add_argument('--output', type=str, default='features.npz',
+                        help='Where to store the file names and feature vectors.')
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--workers', type=int, default=4,
+                        help='Decode/resize worker threads (0 = serial).')
+    parser.add_argument('--queue-depth', type=int, default=64)
+    add_engine_arguments(parser)
+    args = parser.parse_args()
+
+    engine = engine_from_args(args)
+    files = validate_source(args.folder)
+    timer = StageTimer()
+
+    chrono = Chrono()
+    chrono.start()
+    features = embed_files(engine, files, args.batch_size, args.workers, args.queue_depth, timer)
+    time_total = chrono.stop()
+
+    save_features(args.output, files, features)
+    print(f"Saved {features.shape[0]} feature vectors of size {features.shape[1]} to {args.output}")
+    timer.report(time_total)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,190 @@
+import time
+
+import numpy as np
+import onnxruntime as ort
+
+from src.utils.roi import parse_roi
+
+GRAPH_OPTIMIZATION_LEVELS = {
+    'disable': ort.GraphOptimizationLevel.ORT_DISABLE_ALL,
+    'basic': ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+    'extended': ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+    'all': ort.GraphOptimizationLevel.ORT_ENABLE_ALL,
+}
+
+EXECUTION_MODES = {
+    'sequential': ort.ExecutionMode.ORT_SEQUENTIAL,
+    'parallel': ort.ExecutionMode.ORT_PARALLEL,
+}
+
+
+class InferenceEngine:
+    """
+    Wraps a single ONNX Runtime session so the model is loaded and optimized once
+    and then reused for every image.
+
+    intra_op_num_threads / inter_op_num_threads: 0 lets onnxruntime pick.
+    graph_optimization_level: one of GRAPH_OPTIMIZATION_LEVELS.
+    execution_mode: one of EXECUTION_MODES.
+    io_binding: preallocate input/output buffers for max_batch_size samples and
+        bind them once with IOBinding. Preprocessing can write straight into
+        input_buffer, and run() then returns a view of output_buffer that is
+        overwritten by the next call.
+    warmup: number of runs at load time, so the first real frame does not pay
+        for lazy initialisation.
+
+    roi is the crop the model was trained with, read from the ONNX metadata
+    (None = full frame): get_transform(engine.input_size, engine.roi) gives the
+    training preprocessing.
+    """
+
+    def __init__(self, onnx_model_path, providers=None, intra_op_num_threads=0,
+                 inter_op_num_threads=0, graph_optimization_level='all',
+                 execution_mode='sequential', io_binding=False, max_batch_size=1, warmup=0):
+        if graph_optimization_level not in GRAPH_OPTIMIZATION_LEVELS:
+            raise ValueError(f"Unknown graph optimization level: {graph_optimization_level}")
+        if execution_mode not in EXECUTION_MODES:
+            raise ValueError(f"Unknown execution mode: {execution_mode}")
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be >= 1")
+
+        self.onnx_model_path = onnx_model_path
+        self.providers = providers or ['CPUExecutionProvider']
+
+        sess_options = ort.SessionOptions()
+        sess_options.intra_op_num_threads = intra_op_num_threads
+        sess_options.inter_op_num_threads = inter_op_num_threads
+        sess_options.graph_optimization_level = GRAPH_OPTIMIZATION_LEVELS[graph_optimization_level]
+        sess_options.execution_mode = EXECUTION_MODES[execution_mode]
+
+        self.session = ort.InferenceSession(onnx_model_path, sess_options=sess_options,
+                                            providers=self.providers)
+
+        self.input_name = self.session.get_inputs()[0].name
+        self.output_name = self.session.get_outputs()[0].name
+
+        # Square image models are exported as [batch_size, 3, size, size].
+        shape = self.session.get_inputs()[0].shape
+        self.input_size = shape[-1] if len(shape) == 4 and isinstance(shape[-1], int) else None
+        self.metadata = self.session.get_modelmeta().custom_metadata_map
+        self.roi = parse_roi(self.metadata.get('roi'))
+
+        self.io_binding = io_binding
+        self.max_batch_size = max_batch_size
+        self.input_buffer = None
+        self.output_buffer = None
+        self._bindings = {}
+        if io_binding:
+            if not all(isinstance(dim, int) for dim in shape[1:]):
+                raise ValueError(f"IOBinding needs fixed input dimensions, got {shape}")
+            self.input_buffer = np.zeros((max_batch_size, *shape[1:]), dtype=np.float32)
+            # The output width is only known for sure after a run.
+            output = self.session.run([self.output_name], {self.input_name: self.input_buffer[:1]})[0]
+            self.output_buffer = np.zeros((max_batch_size, *output.shape[1:]), dtype=np.float32)
+
+        if warmup > 0:
+            self.warmup(warmup)
+
+    def warmup(self, runs):
+        if self.io_binding:
+            for _ in range(runs):
+                self._run_bound(self.max_batch_size)
+            return
+        input_shape = self.session.get_inputs()[0].shape
+        if not all(isinstance(dim, int) for dim in input_shape[1:]):
+            return
+        dummy = np.zeros((self.max_batch_size, *input_shape[1:]), dtype=np.float32)
+        for _ in range(runs):
+            self.run(dummy)
+
+    def run(self, input_data):
+        if self.io_binding:
+            batch_size = len(input_data)
+            if batch_size > self.max_batch_size:
+                raise ValueError(f"Batch of {batch_size} exceeds the preallocated {self.max_batch_size}")
+            # Skip the copy when preprocessing already wrote into the bound buffer.
+            if input_data.__array_interface__['data'][0] != self.input_buffer.ctypes.data:
+                self.input_buffer[:batch_size] = input_data
+            return self._run_bound(batch_size)
+
+        outputs = self.session.run([self.output_name], {self.input_name: input_data})
+        return outputs[0]
+
+    def _run_bound(self, batch_size):
+        binding = self._bindings.get(batch_size)
+        if binding is None:
+            # Leading slices of C-contiguous buffers are contiguous, bind them in place.
+            inputs = self.input_buffer[:batch_size]
+            outputs = self.output_buffer[:batch_size]
+            binding = self.session.io_binding()
+            binding.bind_input(self.input_name, 'cpu', 0, np.float32, list(inputs.shape), inputs.ctypes.data)
+            binding.bind_output(self.output_name, 'cpu', 0, np.float32, list(outputs.shape), outputs.ctypes.data)
+            self._bindings[batch_size] = binding
+        self.session.run_with_iobinding(binding)
+        return self.output_buffer[:batch_size]
+
+
+def benchmark_latency(engine, batch_size=1, runs=20, warmup=3):
+    """Time session.run on random inputs, returns latency statistics in ms."""
+    if engine.input_size is None:
+        raise ValueError(f"{engine.onnx_model_path} has no fixed image input size")
+    input_data = np.random.rand(batch_size, 3, engine.input_size, engine.input_size).astype(np.float32)
+
+    for _ in range(warmup):
+        engine.run(input_data)
+
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        engine.run(input_data)
+        timings.append(time.perf_counter() - start)
+
+    timings = np.array(timings) * 1000.0
+    return {
+        'mean_ms': float(np.mean(timings)),
+        'p50_ms': float(np.percentile(timings, 50)),
+        'p95_ms': float(np.percentile(timings, 95)),
+        'images_per_s': float(batch_size * 1000.0 / np.mean(timings)),
+    }
+
+
+def to_coordinates(prediction):
+    # Undo the normalization applied to the labels in MyDataset.
+    lat = prediction[0] / 1000.0 + 47.39
+    lon = prediction[1] / 1000.0 - 1.18
+    return float(lat), float(lon)
+
+
+def add_engine_arguments(parser):
+    parser.add_argument('--intra-op-threads', type=int, default=0,
+                        help='Threads used inside an operator (0 = onnxruntime default).')
+    parser.add_argument('--inter-op-threads', type=int, default=0,
+                        help='Threads used across operators (0 = onnxruntime default).')
+    parser.add_argument('--graph-optimization', type=str, default='all',
+                        choices=list(GRAPH_OPTIMIZATION_LEVELS),
+                        help='ONNX Runtime graph optimization level.')
+    parser.add_argument('--execution-mode', type=str, default='sequential',
+                        choices=list(EXECUTION_MODES),
+                        help='ONNX Runtime execution mode.')
+    parser.add_argument('--io-binding', action='store_true',
+                        help='Preallocate and bind input/output buffers (no per-frame allocations).')
+    parser.add_argument('--warmup', type=int, default=0,
+                        help='Number of warm-up runs at load time.')
+    return parser
+
+
+def engine_options_from_args(args):
+    return {
+        'intra_op_num_threads': args.intra_op_threads,
+        'inter_op_num_threads': args.inter_op_threads,
+        'graph_optimization_level': args.graph_optimization,
+        'execution_mode': args.execution_mode,
+        'io_binding': args.io_binding,
+        # Buffers are sized for the largest batch the command will send.
+        'max_batch_size': max(getattr(args, 'batch_size', 1), getattr(args, 'max_batch_size', 1)),
+        'warmup': args.warmup,
+    }
+
+
+def engine_from_args(args, providers=None):
+    return InferenceEngine(args.model, providers=providers, **engine_options_from_args(args))
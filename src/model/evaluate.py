@@ -1,59 +1,118 @@
+import argparse
 import numpy as np
-import onnxruntime as ort
 from PIL import Image
 import torch
 from torch.utils.data import DataLoader
 import torchvision.transforms as T
 
 from src.dataset.dataset import MyDataset
+from src.model.engine import InferenceEngine, add_engine_arguments, engine_from_args, to_coordinates
+from src.model.pipeline import StageTimer
+from src.utils.chrono import Chrono
+from src.utils.geo import haversine_distances, summarize_errors
+from src.utils.roi import RoiCrop
 
-def get_transform():
+def get_transform(size=380, roi=None):
     transform = T.Compose([
-        T.Resize((380, 380)),
+        RoiCrop(roi),
+        T.Resize((size, size)),
         T.ToTensor()
     ])
     return transform
 
 
-def evaluate(onnx_model_path, dataset):
-    session = ort.InferenceSession(onnx_model_path, providers=['CUDAExecutionProvider'])
-    
-    input_name = session.get_inputs()[0].name
-    output_name = session.get_outputs()[0].name
+def predict_dataset(engine, dataset, batch_size=1, num_workers=0, prefetch_factor=2, verbose=True):
+    """Return the predicted and true (lat, lon) coordinates for every sample of the dataset."""
+    # Worker processes decode and resize ahead of the model, up to
+    # prefetch_factor batches each.
+    data_loader = DataLoader(dataset, batch_size=batch_size, shuffle=False, num_workers=num_workers,
+                             prefetch_factor=prefetch_factor if num_workers > 0 else None)
 
-    data_loader = DataLoader(dataset, batch_size=1, shuffle=False)
+    predicted = []
+    expected = []
+    timer = StageTimer()
+    chrono = Chrono()
+    total_chrono = Chrono()
+    total_chrono.start()
 
-    distances = []
+    chrono.start()
+    for images, labels in data_loader:
+        timer.add('wait', chrono.stop(), len(images))
+        input_data = images.numpy()
 
-    for image, labels in data_loader:
-        input_data = image.numpy()
+        chrono.start()
+        predictions = engine.run(input_data)
+        timer.add('inference', chrono.stop(), len(images))
 
-        outputs = session.run([output_name], {input_name: input_data})
-        prediction = outputs[0]
+        for prediction, label in zip(predictions, labels.numpy()):
+            predicted.append(to_coordinates(prediction))
+            expected.append(to_coordinates(label))
 
-        
-        pred_lat = prediction[0][0] / 1000.0 + 47.39
-        pred_lon = prediction[0][1] / 1000.0 - 1.18
-        
-        true_lat = labels[0, 0].item() / 1000.0 + 47.39
-        true_lon = labels[0, 1].item() / 1000.0 - 1.18
+        chrono.start()
 
-        dist = np.sqrt((pred_lat - true_lat)**2 + (pred_lon - true_lon)**2)
-        distances.append(dist)
+    time_total = total_chrono.stop()
+    time_inference = timer.totals.get('inference', 0.0)
+    if verbose and time_inference > 0:
+        print(f"Throughput inference : {len(predicted) / time_inference:.2f} images/s "
+              f"(batch size {batch_size})")
+        print(f"Throughput end-to-end : {len(predicted) / time_total:.2f} images/s")
+        timer.report(time_total)
+
+    return np.array(predicted, dtype=np.float64), np.array(expected, dtype=np.float64)
+
+
+def evaluate(onnx_model_path, dataset, engine=None, batch_size=1, num_workers=0, prefetch_factor=2):
+    if engine is None:
+        engine = InferenceEngine(onnx_model_path, providers=['CUDAExecutionProvider', 'CPUExecutionProvider'])
+
+    predicted, expected = predict_dataset(engine, dataset, batch_size, num_workers, prefetch_factor)
+
+    distances = np.sqrt(np.sum((predicted - expected) ** 2, axis=1))
 
     avg_distance = float(np.mean(distances))
     return avg_distance
 
 
-def main():
-
-    transform = get_transform()
-    dataset = MyDataset(csv_file='dataset.csv', root_dir='./resizeDataSet', transform=transform)
+def evaluate_errors(engine, dataset, batch_size=1, num_workers=0, prefetch_factor=2, verbose=True):
+    """Return the error of every sample in metres."""
+    predicted, expected = predict_dataset(engine, dataset, batch_size, num_workers, prefetch_factor, verbose)
+    return haversine_distances(predicted, expected)
 
 
-    avg_dist = evaluate("kart_resnet50.onnx", dataset)
+def main():
+    parser = argparse.ArgumentParser(description='Evaluate an ONNX model on a labelled dataset.')
+    parser.add_argument('--model', type=str, default='kart_resnet50.onnx',
+                        help='Path to the ONNX model file.')
+    parser.add_argument('--csv', type=str, default='dataset.csv',
+                        help='CSV file with the labels.')
+    parser.add_argument('--root', type=str, default='./resizeDataSet',
+                        help='Folder containing the images.')
+    parser.add_argument('--batch-size', type=int, default=1,
+                        help='Number of images sent to the model per run.')
+    parser.add_argument('--workers', type=int, default=4,
+                        help='DataLoader worker processes decoding images ahead of the model.')
+    parser.add_argument('--prefetch-factor', type=int, default=2,
+                        help='Batches prefetched by each worker.')
+    parser.add_argument('--subset', type=str, default=None,
+                        help='Only evaluate the frames of this subset manifest (src.dataset.subset).')
+    add_engine_arguments(parser)
+    args = parser.parse_args()
+
+    engine = engine_from_args(args, providers=['CUDAExecutionProvider', 'CPUExecutionProvider'])
+
+    transform = get_transform(engine.input_size or 380, engine.roi)
+    dataset = MyDataset(csv_file=args.csv, root_dir=args.root, transform=transform, subset=args.subset)
+
+    predicted, expected = predict_dataset(engine, dataset, batch_size=args.batch_size,
+                                          num_workers=args.workers, prefetch_factor=args.prefetch_factor)
+
+    avg_dist = float(np.mean(np.sqrt(np.sum((predicted - expected) ** 2, axis=1))))
     print(f"Average Euclidean Distance: {avg_dist:.6f}")
 
+    summary = summarize_errors(haversine_distances(predicted, expected))
+    print(f"Error in metres: mean {summary['mean_m']:.2f} | median {summary['median_m']:.2f} "
+          f"| p95 {summary['p95_m']:.2f}")
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,96 @@
+import argparse
+
+import onnx
+import torch
+
+from src.model.networks import ARCHITECTURES, KartModel, parse_widths
+from src.utils.roi import add_roi_argument, format_roi
+
+
+def set_metadata(onnx_model_path, metadata):
+    """Store string key/values in the model metadata_props (read back by InferenceEngine.metadata)."""
+    # External weight files stay where they are, only the graph file is rewritten.
+    model = onnx.load(onnx_model_path, load_external_data=False)
+    for key, value in metadata.items():
+        entry = next((prop for prop in model.metadata_props if prop.key == key), None) or model.metadata_props.add()
+        entry.key, entry.value = key, str(value)
+    onnx.save(model, onnx_model_path)
+    return onnx_model_path
+
+
+def export_onnx(module, dummy_input, onnx_model_path, input_name='input', output_name='output', metadata=None):
+    module.eval()
+    torch.onnx.export(
+        module,                     # Model to be exported
+        dummy_input,                # Example input tensor
+        onnx_model_path,            # Path to save the ONNX model
+        export_params=True,         # Store the trained parameter weights inside the model file
+        opset_version=12,           # The ONNX version to export the model to
+        do_constant_folding=True,   # Whether to execute constant folding for optimization
+        input_names=[input_name],   # The model's input names
+        output_names=[output_name], # The model's output names
+        dynamic_axes={
+            input_name: {0: 'batch_size'},   # Variable batch size
+            output_name: {0: 'batch_size'}
+        }
+    )
+    if metadata:
+        set_metadata(onnx_model_path, metadata)
+    return onnx_model_path
+
+
+def export_split(model, input_size, output_prefix, device='cpu', roi=None):
+    """
+    Export the combined model ({prefix}.onnx), the backbone alone
+    ({prefix}_backbone.onnx, image -> features) and the head alone
+    ({prefix}_head.onnx, features -> lat/lon). The image models record the ROI
+    crop they were trained with in their metadata.
+    """
+    metadata = {'roi': format_roi(roi)}
+    dummy_input = torch.randn(1, 3, input_size, input_size, device=device)
+    with torch.no_grad():
+        dummy_features = model.backbone(dummy_input)
+
+    return {
+        'combined': export_onnx(model, dummy_input, f"{output_prefix}.onnx", metadata=metadata),
+        'backbone': export_onnx(model.backbone, dummy_input, f"{output_prefix}_backbone.onnx",
+                                output_name='features', metadata=metadata),
+        'head': export_onnx(model.classifier, dummy_features, f"{output_prefix}_head.onnx",
+                            input_name='features'),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export a trained model as combined, backbone and head ONNX files.')
+    parser.add_argument('--arch', type=str, default='b4', choices=list(ARCHITECTURES),
+                        help='Model architecture.')
+    parser.add_argument('--backbone', type=str, default=None,
+                        help='torchvision backbone name, for models trained with src.model.train --backbone.')
+    parser.add_argument('--head-widths', type=parse_widths, default=None,
+                        help='Comma separated hidden layer widths of the head (default: 1024,128,64).')
+    parser.add_argument('--input-size', type=int, default=None,
+                        help='Input resolution (default: the architecture one).')
+    parser.add_argument('--weights', type=str, default='best_model.pth',
+                        help='State dict saved by the training script.')
+    parser.add_argument('--output-prefix', type=str, default=None,
+                        help='Prefix of the exported files (default: same names as the training scripts).')
+    add_roi_argument(parser)
+    args = parser.parse_args()
+
+    model_class = ARCHITECTURES[args.arch]
+    if args.backbone is None and args.head_widths is None:
+        model = model_class(pretrained=False)
+    else:
+        model = KartModel(args.backbone or model_class.backbone_name, args.head_widths or (1024, 128, 64),
+                          pretrained=False)
+    model.load_state_dict(torch.load(args.weights, map_location='cpu'))
+
+    output_prefix = args.output_prefix or model_class.export_name
+    exported = export_split(model, args.input_size or model_class.input_size, output_prefix, roi=args.roi)
+
+    for part, path in exported.items():
+        print(f"Model ({part}) has been exported to {path}")
+
+
+if __name__ == '__main__':
+    main()
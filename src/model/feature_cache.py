@@ -0,0 +1,150 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+import torch
+from torch.utils.data import DataLoader, Dataset
+
+from src.dataset.dataset import MyDataset, manifest_hash
+from src.model.evaluate import get_transform
+from src.model.networks import ARCHITECTURES
+from src.utils.chrono import Chrono
+from src.utils.roi import add_roi_argument, format_roi
+
+DTYPES = {'float16': np.float16, 'float32': np.float32}
+
+
+def weights_digest(module):
+    digest = hashlib.sha256()
+    for name, value in module.state_dict().items():
+        digest.update(name.encode())
+        digest.update(value.detach().cpu().contiguous().numpy().tobytes())
+    return digest.hexdigest()[:8]
+
+
+def cache_path(cache_dir, arch, input_size, manifest, dtype='float16', roi=None, weights=None):
+    # weights: None for the pretrained backbone, else a weights_digest of the random one.
+    size = input_size if roi is None else f"{input_size}_roi{format_roi(roi).replace(',', '-')}"
+    if weights is not None:
+        size = f"{size}_random{weights}"
+    return os.path.join(cache_dir, f"{arch}_{size}_{dtype}_{manifest[:16]}")
+
+
+def build_feature_cache(model, dataset, path, dtype='float16', batch_size=32, num_workers=0, device='cpu'):
+    """
+    Run the frozen backbone once over the dataset and store the pooled features
+    in {path}/features.npy (memory-mappable) with the labels in {path}/labels.npy.
+    """
+    tmp_path = path + '.tmp'
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    features = np.lib.format.open_memmap(os.path.join(tmp_path, 'features.npy'), mode='w+',
+                                         dtype=DTYPES[dtype], shape=(len(dataset), model.feature_size))
+    labels = np.zeros((len(dataset), 2), dtype=np.float32)
+
+    backbone = model.backbone.to(device).eval()
+    data_loader = DataLoader(dataset, batch_size=batch_size, shuffle=False, num_workers=num_workers)
+    chrono = Chrono()
+    chrono.start()
+    index = 0
+    with torch.no_grad():
+        for images, targets in data_loader:
+            batch = backbone(images.to(device)).cpu().numpy()
+            features[index:index + len(batch)] = batch
+            labels[index:index + len(batch)] = targets.numpy()
+            index += len(batch)
+    print(f"Features computed for {index} images in {chrono.stop():.2f} seconds")
+
+    features.flush()
+    del features
+    np.save(os.path.join(tmp_path, 'labels.npy'), labels)
+    with open(os.path.join(tmp_path, 'meta.json'), 'w') as f:
+        json.dump({'samples': index, 'feature_size': model.feature_size, 'dtype': dtype,
+                   'files': [file_name for file_name, _, _ in dataset.samples]}, f)
+
+    # Only a complete cache gets the final name.
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp_path, path)
+    return path
+
+
+def get_feature_cache(arch, csv_file, root_dir, cache_dir='feature_cache', dtype='float16', batch_size=32,
+                      num_workers=0, device='cpu', model=None, input_size=None, roi=None, pretrained=True):
+    """
+    Return the cache directory for this backbone/dataset, building it if missing or stale.
+    Any other backbone than the ARCHITECTURES ones can be cached by passing its
+    KartModel as `model` and its resolution as `input_size`, arch then only names the cache.
+    A model with random backbone weights (pretrained=False) gets its own cache,
+    named after a digest of those weights.
+    """
+    if not pretrained and model is None:
+        raise ValueError("pretrained=False needs the model whose random backbone is cached")
+    input_size = input_size or ARCHITECTURES[arch].input_size
+    weights = None if pretrained else weights_digest(model.backbone)
+    dataset = MyDataset(csv_file=csv_file, root_dir=root_dir, transform=get_transform(input_size, roi))
+    manifest = manifest_hash(dataset.samples, dataset.root_dir)
+    path = cache_path(cache_dir, arch, input_size, manifest, dtype, roi, weights)
+
+    if os.path.exists(os.path.join(path, 'meta.json')):
+        print(f"Using cached features from {path}")
+        return path
+
+    # Caches of older versions of the dataset are never read again.
+    prefix = os.path.basename(cache_path(cache_dir, arch, input_size, '', dtype, roi, weights))
+    if os.path.isdir(cache_dir):
+        for name in os.listdir(cache_dir):
+            if name.startswith(prefix):
+                print(f"Removing stale feature cache {name}")
+                shutil.rmtree(os.path.join(cache_dir, name), ignore_errors=True)
+
+    print(f"Building feature cache {path}")
+    model = model or ARCHITECTURES[arch](pretrained=True)
+    return build_feature_cache(model, dataset, path, dtype, batch_size, num_workers, device)
+
+
+class FeatureDataset(Dataset):
+    """(features, labels) pairs read from a feature cache, features stay memory-mapped."""
+
+    def __init__(self, path):
+        self.features = np.load(os.path.join(path, 'features.npy'), mmap_mode='r')
+        self.labels = np.load(os.path.join(path, 'labels.npy'))
+
+    def __len__(self):
+        return len(self.labels)
+
+    def __getitem__(self, idx):
+        features = torch.from_numpy(self.features[idx].astype(np.float32))
+        labels = torch.from_numpy(self.labels[idx])
+        return features, labels
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compute the frozen backbone features of the dataset once.')
+    parser.add_argument('--arch', type=str, default='b4', choices=list(ARCHITECTURES),
+                        help='Model architecture.')
+    parser.add_argument('--csv', type=str, default='dataset.csv',
+                        help='CSV file with the labels.')
+    parser.add_argument('--root', type=str, default='./resizeDataSet',
+                        help='Folder containing the images.')
+    parser.add_argument('--cache-dir', type=str, default='feature_cache',
+                        help='Folder where the feature caches are stored.')
+    parser.add_argument('--dtype', type=str, default='float16', choices=list(DTYPES),
+                        help='Storage type of the cached features.')
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--workers', type=int, default=0,
+                        help='DataLoader worker processes.')
+    add_roi_argument(parser)
+    args = parser.parse_args()
+
+    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    path = get_feature_cache(args.arch, args.csv, args.root, args.cache_dir, args.dtype,
+                             args.batch_size, args.workers, device, roi=args.roi)
+    print(f"Feature cache: {path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,181 @@
+import argparse
+import sys
+
+import numpy as np
+
+from src.model.engine import add_engine_arguments, engine_from_args, to_coordinates
+from src.model.infer import get_transform, run_inference
+from src.model.stream import RecordWriter, frame_to_array, iter_video_frames, video_fps
+from src.utils.chrono import Chrono
+from src.utils.geo import haversine_distances, summarize_errors
+from src.utils.track import Track
+
+
+class AdaptiveFrameScheduler:
+    """
+    Decides how many frames to skip between two model runs.
+
+    The interval is chosen so the kart moves about target_spacing_m along the
+    track between two fixes, using the speed measured between the last two
+    fixes. When a new fix disagrees with the position predicted from that
+    speed by more than max_disagreement_m, the interval is halved.
+    """
+
+    def __init__(self, track, min_interval=1, max_interval=15, target_spacing_m=3.0, max_disagreement_m=8.0):
+        if not 1 <= min_interval <= max_interval:
+            raise ValueError("expected 1 <= min_interval <= max_interval")
+        self.track = track
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.target_spacing_m = target_spacing_m
+        self.max_disagreement_m = max_disagreement_m
+
+        self.interval = min_interval
+        self.last_fix = None   # (frame_index, arc length)
+        self.speed = None      # metres per frame along the track, signed
+
+    def update(self, frame_index, lat, lon):
+        """Register a model fix, returns its arc length on the track."""
+        s, _ = self.track.project(lat, lon)
+
+        if self.last_fix is not None:
+            last_index, last_s = self.last_fix
+            frames = frame_index - last_index
+            moved = self.track.delta(last_s, s)
+
+            disagreement = abs(moved - self.speed * frames) if self.speed is not None else 0.0
+            self.speed = moved / frames
+
+            if disagreement > self.max_disagreement_m:
+                self.interval = max(self.min_interval, self.interval // 2)
+            else:
+                interval = self.target_spacing_m / max(abs(self.speed), 1e-3)
+                self.interval = int(min(max(round(interval), self.min_interval), self.max_interval))
+
+        self.last_fix = (frame_index, s)
+        return s
+
+
+def adaptive_predictions(engine, video_path, scheduler, full_rate=False):
+    """
+    Yield (frame_index, timestamp, lat, lon, source, reference_lat, reference_lon)
+    for every frame of the video. source is 'model' for frames sent to the
+    network and 'interpolated' for frames filled along the track between two
+    fixes ('held' after the last fix). With full_rate, every frame also goes
+    through the model to provide the reference position.
+    """
+    transform = get_transform(engine.input_size or 380, engine.roi)
+    track = scheduler.track
+    state = {'next': 0}
+
+    def predict(frame):
+        return to_coordinates(run_inference(engine, frame_to_array(frame, transform))[0])
+
+    def decode(frame_index):
+        return full_rate or frame_index == state['next']
+
+    pending = []   # (frame_index, timestamp, reference) since the last fix, at most max_interval
+    previous = None  # (frame_index, arc length, lat, lon)
+
+    for frame_index, timestamp, frame in iter_video_frames(video_path, decode=decode):
+        reference = predict(frame) if full_rate and frame is not None else (None, None)
+
+        if frame_index != state['next']:
+            pending.append((frame_index, timestamp, reference))
+            continue
+
+        lat, lon = reference if full_rate else predict(frame)
+        s = scheduler.update(frame_index, lat, lon)
+
+        if previous is not None:
+            previous_index, previous_s, previous_lat, previous_lon = previous
+            for pending_index, pending_timestamp, pending_reference in pending:
+                fraction = (pending_index - previous_index) / (frame_index - previous_index)
+                pending_lat, pending_lon = track.interpolate_fixes((previous_lat, previous_lon), previous_s,
+                                                                   (lat, lon), s, fraction)
+                yield (pending_index, pending_timestamp, pending_lat, pending_lon, 'interpolated',
+                       *pending_reference)
+        pending = []
+
+        yield frame_index, timestamp, lat, lon, 'model', *reference
+        previous = (frame_index, s, lat, lon)
+        state['next'] = frame_index + scheduler.interval
+
+    # Frames after the last fix cannot be interpolated, hold the last position.
+    for pending_index, pending_timestamp, pending_reference in pending:
+        if previous is not None:
+            yield (pending_index, pending_timestamp, previous[2], previous[3], 'held', *pending_reference)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Adaptive frame-skipping inference on an onboard video.')
+    parser.add_argument('--model', type=str, default='kart_efficientb4.onnx',
+                        help='Path to the ONNX model file.')
+    parser.add_argument('--video', type=str, required=True,
+                        help='Path to the .mp4 video.')
+    parser.add_argument('--coordinates', type=str, default='data/coordinates.json',
+                        help='Recorded coordinates used to build the track polyline.')
+    parser.add_argument('--world', type=str, default='data/theworld.json',
+                        help='Circuit definitions, used to cut one lap at the start line.')
+    parser.add_argument('--circuit', type=str, default='Ancenis')
+    parser.add_argument('--min-interval', type=int, default=1,
+                        help='Minimum number of frames between two model runs.')
+    parser.add_argument('--max-interval', type=int, default=15,
+                        help='Maximum number of frames between two model runs.')
+    parser.add_argument('--target-spacing', type=float, default=3.0,
+                        help='Distance in metres the kart should travel between two model runs.')
+    parser.add_argument('--max-disagreement', type=float, default=8.0,
+                        help='Halve the interval when a fix is this far (metres) from the predicted position.')
+    parser.add_argument('--compare-full-rate', action='store_true',
+                        help='Also run the model on every frame and report the interpolation error.')
+    parser.add_argument('--format', type=str, default='csv', choices=['csv', 'json'])
+    parser.add_argument('--output', type=str, default='-',
+                        help='Output file, "-" for stdout.')
+    add_engine_arguments(parser)
+    args = parser.parse_args()
+
+    engine = engine_from_args(args)
+    track = Track.from_files(args.coordinates, args.world, args.circuit)
+    scheduler = AdaptiveFrameScheduler(track, args.min_interval, args.max_interval,
+                                       args.target_spacing, args.max_disagreement)
+
+    fields = ('frame_index', 'timestamp', 'lat', 'lon', 'source')
+    if args.compare_full_rate:
+        fields += ('error_m',)
+    writer = RecordWriter(args.output, args.format, fields)
+
+    chrono = Chrono()
+    chrono.start()
+    frames = 0
+    model_runs = 0
+    errors = []
+    try:
+        for frame_index, timestamp, lat, lon, source, ref_lat, ref_lon in adaptive_predictions(
+                engine, args.video, scheduler, args.compare_full_rate):
+            frames += 1
+            model_runs += source == 'model'
+            record = (frame_index, timestamp, lat, lon, source)
+            if args.compare_full_rate:
+                error = float(haversine_distances(np.array([[lat, lon]]), np.array([[ref_lat, ref_lon]]))[0])
+                errors.append(error)
+                record += (error,)
+            writer.write(record)
+    finally:
+        writer.close()
+    time_total = chrono.stop()
+
+    if frames:
+        fps = video_fps(args.video)
+        duration = frames / fps if fps > 0 else None
+        print(f"Frames: {frames} | model runs: {model_runs} ({100.0 * model_runs / frames:.1f} %) "
+              f"| processed in {time_total:.2f} s", file=sys.stderr)
+        if duration:
+            print(f"Effective model fps: {model_runs / duration:.2f} (video {fps:.2f} fps)", file=sys.stderr)
+        if errors:
+            summary = summarize_errors(np.array(errors))
+            print(f"Error vs full-rate inference: mean {summary['mean_m']:.2f} m | "
+                  f"median {summary['median_m']:.2f} m | p95 {summary['p95_m']:.2f} m", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
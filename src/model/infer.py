@@ -1,104 +1,162 @@
 import argparse
-import torch
-import onnxruntime as ort
+import numpy as np
 from PIL import Image
-import torchvision.transforms as T
 
+from src.model.engine import add_engine_arguments, engine_from_args, to_coordinates
+from src.model.pipeline import PrefetchPipeline, StageTimer
+from src.model.preprocess import ToArray
 from src.utils.chrono import Chrono
 from src.utils.utils import validate_source
 
-def get_transform():
-    transform = T.Compose([
-        T.Resize((380, 380)),
-        T.ToTensor()
-    ])
-    return transform
+def get_transform(size=380, roi=None):
+    # NumPy preprocessing, matches evaluate.get_transform (ROI crop, T.Resize((size, size)), T.ToTensor())
+    # without importing torch.
+    return ToArray(size, roi)
 
-def load_image(image_path, transform):
+def load_image(image_path, transform, out=None):
     image = Image.open(image_path).convert('RGB')
-    image_tensor = transform(image)
+    if out is not None:
+        # Preprocess in place, e.g. into engine.input_buffer[0] with --io-binding.
+        return transform(image, out=out)[np.newaxis]
+    image_array = transform(image)
     # Add a batch dimension since ONNX model expects [batch_size, 3, 224, 224].
-    return image_tensor.unsqueeze(0)
+    return image_array[np.newaxis]
 
-def run_inference(onnx_model_path, image_tensor):
-    # providers = [("CUDAExecutionProvider", {"device_id": torch.cuda.current_device(),
-    #                                         "user_compute_stream": str(torch.cuda.current_stream().cuda_stream)})]
-    # sess_options = ort.SessionOptions()
-    # session = ort.InferenceSession(onnx_model_path, sess_options=sess_options, providers=providers)
-    session = ort.InferenceSession(onnx_model_path, providers=['CPUExecutionProvider'])
 
-    input_name = session.get_inputs()[0].name
-    output_name = session.get_outputs()[0].name
+def run_inference(engine, input_data):
+    return engine.run(input_data)
+
+def infer_features(engine, features_path, batch_size):
+    # Features cached by src.model.embed, to be used with a *_head.onnx model.
+    data = np.load(features_path)
+    features = data['features'].astype(np.float32)
 
-    input_data = image_tensor.numpy()
+    chrono = Chrono()
+    chrono.start()
+    for start in range(0, len(features), batch_size):
+        predictions = engine.run(features[start:start + batch_size])
+        for prediction in predictions:
+            lat, lon = to_coordinates(prediction)
+            print(f"({lat:.8f}, {lon:.8f}),")
+    time_inference = chrono.stop()
 
-    outputs = session.run([output_name], {input_name: input_data})
-    return outputs[0]
+    print(f"Average Time inference : {time_inference / len(features):.5f} seconds per feature vector")
 
 def main():
     parser = argparse.ArgumentParser(description='Infer coordinates using ONNX model.')
     parser.add_argument('--model', type=str, default='kart_resnet50.onnx',
                         help='Path to the ONNX model file.')
-    parser.add_argument('--image', type=str, required=True,
+    parser.add_argument('--image', type=str, required=False,
                         help='Path to the input image.')
     parser.add_argument('--folder', type=str, required=False,
-                        help='Path to the folder of images.')
+                        help='Path to the folder of images (or a *.subset.json manifest).')
+    parser.add_argument('--features', type=str, required=False,
+                        help='Feature vectors cached by src.model.embed (use with a *_head.onnx model).')
+    parser.add_argument('--batch-size', type=int, default=1,
+                        help='Number of images sent to the model per run in --folder/--features mode.')
+    parser.add_argument('--workers', type=int, default=4,
+                        help='Decode/resize worker threads in --folder mode (0 = serial).')
+    parser.add_argument('--queue-depth', type=int, default=16,
+                        help='Maximum number of frames decoded ahead of the model.')
+    parser.add_argument('--compare-reload', action='store_true',
+                        help='Also time the old behaviour (new session for every image).')
+    add_engine_arguments(parser)
     args = parser.parse_args()
 
+    if args.image is None and args.folder is None and args.features is None:
+        parser.error('one of --image, --folder or --features is required')
+    if args.batch_size < 1:
+        parser.error('--batch-size must be at least 1')
+
+    chrono = Chrono()
+    chrono.start()
+    # providers = [("CUDAExecutionProvider", {"device_id": torch.cuda.current_device(),
+    #                                         "user_compute_stream": str(torch.cuda.current_stream().cuda_stream)})]
+    engine = engine_from_args(args)
+    time_load = chrono.stop()
+    print(f"Time loading model : {time_load:.5f} seconds")
+
+    if args.features is not None:
+        infer_features(engine, args.features, args.batch_size)
+        return
+
+    transform = get_transform(engine.input_size or 380, engine.roi)
+
     if args.folder is None:
-        transform = get_transform()
-        image_tensor = load_image(args.image, transform)
+        out = engine.input_buffer[0] if engine.io_binding else None
+        input_data = load_image(args.image, transform, out)
 
-        chrono = Chrono()
         chrono.start()
 
-        prediction = run_inference(args.model, image_tensor)
+        prediction = run_inference(engine, input_data)
 
         time_inference = chrono.stop()
 
         print(f"Time inference : {time_inference:.5f} seconds")
 
-        lat = prediction[0][0] /1000.0 + 47.39
-        lon = prediction[0][1] /1000.0 - 1.18
+        if args.compare_reload:
+            chrono.start()
+            run_inference(engine_from_args(args), input_data)
+            print(f"Time inference with a new session : {chrono.stop():.5f} seconds")
+
+        lat, lon = to_coordinates(prediction[0])
 
         print("Predicted coordinates:", lat, lon)  # [x, y] for example
 
     else:
         time_moy = 0
+        time_reload_moy = 0
         files = validate_source(args.folder)
         # print(files)
         point = (0, 0)
         i = 0
         index_moy = 1
-        for file in files:
 
-            transform = get_transform()
-            image_tensor = load_image(file, transform)
+        timer = StageTimer()
+        pipeline = PrefetchPipeline(lambda file: load_image(file, transform), np.concatenate,
+                                    workers=args.workers, queue_depth=args.queue_depth, timer=timer,
+                                    batch_buffer=engine.input_buffer)
+
+        total_chrono = Chrono()
+        total_chrono.start()
+        for batch_files, input_data in pipeline.batches(files, args.batch_size):
 
-            chrono = Chrono()
             chrono.start()
 
-            prediction = run_inference(args.model, image_tensor)
+            predictions = run_inference(engine, input_data)
 
             time_inference = chrono.stop()
+            timer.add('inference', time_inference, len(batch_files))
 
             time_moy += time_inference
 
-
-            lat = prediction[0][0] / 1000.0 + 47.39
-            lon = prediction[0][1] / 1000.0 - 1.18
-
-            i += 1
-            point = (point[0] + lat, point[1] + lon)
-            if i % index_moy == 0:
-                point = (point[0] / index_moy, point[1] / index_moy)
-                print(f"({point[0]:.8f}, {point[1]:.8f}),")
-                point = (0, 0)
-
-
-        time_moy /= len(files)
-
-        print(f"Average Time inference : {time_moy:.5f} seconds")
+            if args.compare_reload:
+                chrono.start()
+                run_inference(engine_from_args(args), input_data)
+                time_reload_moy += chrono.stop()
+
+            # Outputs come back in the same order as the stacked images.
+            for prediction in predictions:
+                lat, lon = to_coordinates(prediction)
+
+                i += 1
+                point = (point[0] + lat, point[1] + lon)
+                if i % index_moy == 0:
+                    point = (point[0] / index_moy, point[1] / index_moy)
+                    print(f"({point[0]:.8f}, {point[1]:.8f}),")
+                    point = (0, 0)
+
+        time_total = total_chrono.stop()
+
+        print(f"Average Time inference : {time_moy / len(files):.5f} seconds per image "
+              f"(batch size {args.batch_size})")
+        print(f"Throughput inference : {len(files) / time_moy:.2f} images/s")
+        print(f"Throughput end-to-end : {len(files) / time_total:.2f} images/s")
+        timer.report(time_total)
+
+        if args.compare_reload:
+            time_reload_moy /= len(files)
+            print(f"Average Time inference with a new session per image : {time_reload_moy:.5f} seconds")
 
 
 if __name__ == '__main__':
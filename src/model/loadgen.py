@@ -0,0 +1,106 @@
+import argparse
+import asyncio
+import json
+import time
+
+import numpy as np
+
+from src.utils.utils import validate_source
+
+
+async def open_connection(host, port, unix_socket):
+    if unix_socket is not None:
+        return await asyncio.open_unix_connection(unix_socket)
+    return await asyncio.open_connection(host, port)
+
+
+async def request(reader, writer, method, path, body=b''):
+    head = (f"{method} {path} HTTP/1.1\r\n"
+            f"Host: localhost\r\n"
+            f"Content-Length: {len(body)}\r\n\r\n")
+    writer.write(head.encode('latin-1') + body)
+    await writer.drain()
+
+    status = int((await reader.readline()).split(b' ')[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.strip().lower() == 'content-length':
+            length = int(value)
+    payload = json.loads(await reader.readexactly(length)) if length else None
+    return status, payload
+
+
+async def client(images, count, host, port, unix_socket, latencies, failures):
+    reader, writer = await open_connection(host, port, unix_socket)
+    try:
+        for i in range(count):
+            start = time.perf_counter()
+            status, _ = await request(reader, writer, 'POST', '/predict', images[i % len(images)])
+            if status == 200:
+                latencies.append(time.perf_counter() - start)
+            else:
+                failures.append(status)
+    finally:
+        writer.close()
+
+
+async def run(args):
+    images = []
+    for file in validate_source(args.images):
+        with open(file, 'rb') as f:
+            images.append(f.read())
+    if not images:
+        raise ValueError(f"No images found in {args.images}")
+
+    latencies, failures = [], []
+    # Exactly --requests in total: the first requests % concurrency clients send one more,
+    # and no connection is opened for a client with nothing to send.
+    counts = [args.requests // args.concurrency + (i < args.requests % args.concurrency)
+              for i in range(args.concurrency)]
+
+    start = time.perf_counter()
+    await asyncio.gather(*[
+        client(images, count, args.host, args.port, args.unix_socket, latencies, failures)
+        for count in counts if count > 0
+    ])
+    elapsed = time.perf_counter() - start
+
+    print(f"{len(latencies)} requests OK, {len(failures)} failed in {elapsed:.2f} s "
+          f"({len(latencies) / elapsed:.2f} requests/s, concurrency {args.concurrency})")
+    if latencies:
+        latencies = np.array(latencies) * 1000.0
+        print("Client latency (ms): " + " | ".join(
+            f"p{p} {np.percentile(latencies, p):.2f}" for p in (50, 90, 95, 99)))
+
+    reader, writer = await open_connection(args.host, args.port, args.unix_socket)
+    try:
+        _, stats = await request(reader, writer, 'GET', '/stats')
+    finally:
+        writer.close()
+    print("Server stats:", json.dumps(stats, indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load generator for src.model.server.')
+    parser.add_argument('--images', type=str, required=True,
+                        help='Image file or folder of images to send.')
+    parser.add_argument('--host', type=str, default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--unix-socket', type=str, default=None)
+    parser.add_argument('--requests', type=int, default=500,
+                        help='Total number of requests.')
+    parser.add_argument('--concurrency', type=int, default=16,
+                        help='Number of concurrent connections.')
+    args = parser.parse_args()
+    if args.requests < 1 or args.concurrency < 1:
+        parser.error('--requests and --concurrency must be at least 1')
+
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+import torch.nn as nn
+import torchvision.models as models
+
+
+def strip_classifier(backbone):
+    """
+    Replace the last Linear layer of a torchvision classifier by an Identity so
+    the model outputs its pooled features. Returns the feature size.
+    """
+    for name in ('classifier', 'fc', 'heads', 'head'):
+        top = getattr(backbone, name, None)
+        if top is None:
+            continue
+        if isinstance(top, nn.Linear):
+            setattr(backbone, name, nn.Identity())
+            return top.in_features
+        linear_layers = [(index, layer) for index, layer in enumerate(top) if isinstance(layer, nn.Linear)]
+        if linear_layers:
+            index, layer = linear_layers[-1]
+            top[index] = nn.Identity()
+            return layer.in_features
+    raise ValueError(f"Don't know how to remove the classifier of {type(backbone).__name__}")
+
+
+def parse_widths(value):
+    # "1024,128,64" -> (1024, 128, 64), for the command line options.
+    return tuple(int(width) for width in value.split(',') if width)
+
+
+def make_head(feature_size, head_widths=(1024, 128, 64)):
+    layers = []
+    for width in head_widths:
+        layers += [nn.Linear(feature_size, width), nn.ReLU()]
+        feature_size = width
+    # nn.Dropout(0.5),
+    layers.append(nn.Linear(feature_size, 2))
+    return nn.Sequential(*layers)
+
+
+class KartModel(nn.Module):
+    """
+    Frozen torchvision backbone (any name accepted by torchvision.models.get_model)
+    followed by a trainable MLP head regressing the normalized (lat, lon).
+    """
+
+    def __init__(self, backbone='efficientnet_b4', head_widths=(1024, 128, 64), pretrained=True):
+        super(KartModel, self).__init__()
+
+        self.backbone = models.get_model(backbone, weights='DEFAULT' if pretrained else None)
+
+        # remove top
+        self.feature_size = strip_classifier(self.backbone)
+
+        # freeze
+        for param in self.backbone.parameters():
+            param.requires_grad = False
+
+        self.classifier = make_head(self.feature_size, head_widths)
+
+    def forward(self, x):
+        features = self.backbone(x)
+        out = self.classifier(features)
+        return out
+
+
+class KartEfficientB4(KartModel):
+    input_size = 380
+    export_name = 'kart_efficientb4'
+    backbone_name = 'efficientnet_b4'
+    feature_size = 1792
+
+    def __init__(self, pretrained=True):
+        # self.backbone = models.resnet50(weights=models.ResNet50_Weights.DEFAULT if pretrained else None)
+        super(KartEfficientB4, self).__init__(self.backbone_name, pretrained=pretrained)
+
+
+class KartEfficientB7(KartModel):
+    input_size = 600
+    export_name = 'kart_efficientB7'
+    backbone_name = 'efficientnet_b7'
+    feature_size = 2560
+
+    def __init__(self, pretrained=True):
+        super(KartEfficientB7, self).__init__(self.backbone_name, pretrained=pretrained)
+
+
+ARCHITECTURES = {
+    'b4': KartEfficientB4,
+    'b7': KartEfficientB7,
+}
@@ -0,0 +1,180 @@
+import argparse
+import json
+import os
+
+import torch
+from torch.utils.data import Subset
+
+from src.dataset.dataset import MyDataset
+from src.model.engine import InferenceEngine, add_engine_arguments, benchmark_latency, engine_options_from_args
+from src.model.evaluate import evaluate_errors, get_transform
+from src.model.export import export_split
+from src.model.feature_cache import DTYPES, FeatureDataset, get_feature_cache
+from src.model.networks import KartModel, parse_widths
+from src.model.train import LOSSES, split_dataset
+from src.model.train_head import train_head
+from src.utils.geo import summarize_errors
+from src.utils.roi import add_roi_argument, format_roi
+from src.utils.utils import format_table, model_size_mb
+
+
+def measure_model(name, path, dataset, engine_options=None, batch_size=8, latency_runs=20):
+    """Error (metres) on the dataset, CPU latency at batch 1 and 32 and size of an ONNX model."""
+    engine = InferenceEngine(path, **(engine_options or {}))
+    summary = summarize_errors(evaluate_errors(engine, dataset, batch_size=batch_size, verbose=False))
+    latency_1 = benchmark_latency(engine, batch_size=1, runs=latency_runs)
+    latency_32 = benchmark_latency(engine, batch_size=32, runs=latency_runs)
+    print(f"Measured {name} ({path})")
+    return {
+        'name': name,
+        'path': path,
+        'input_size': engine.input_size,
+        'roi': format_roi(engine.roi),
+        'size_mb': model_size_mb(path),
+        **summary,
+        'latency_b1_ms': latency_1['mean_ms'],
+        'latency_b32_ms': latency_32['mean_ms'],
+        'images_per_s': latency_32['images_per_s'],
+    }
+
+
+def pareto_front(rows, cost='latency_b1_ms', error='mean_m'):
+    """Mark the rows no other row beats on both cost and error (row['pareto'] = True)."""
+    for row in rows:
+        row['pareto'] = not any(other[cost] <= row[cost] and other[error] <= row[error]
+                                and (other[cost] < row[cost] or other[error] < row[error])
+                                for other in rows)
+    return [row for row in rows if row['pareto']]
+
+
+def plot_pareto(rows, path, cost='latency_b1_ms', error='mean_m'):
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    fig, ax = plt.subplots(figsize=(8, 6))
+    ax.scatter([row[cost] for row in rows], [row[error] for row in rows],
+               c=['tab:red' if row['pareto'] else 'tab:gray' for row in rows])
+    for row in rows:
+        ax.annotate(row['name'], (row[cost], row[error]), textcoords='offset points', xytext=(4, 4), fontsize=8)
+    front = sorted((row for row in rows if row['pareto']), key=lambda row: row[cost])
+    ax.step([row[cost] for row in front], [row[error] for row in front], where='post', color='tab:red')
+    ax.set_xlabel('CPU latency at batch 1 (ms)')
+    ax.set_ylabel('Mean error (m)')
+    ax.set_title('Accuracy / latency Pareto front')
+    ax.grid(True, alpha=0.3)
+    fig.tight_layout()
+    fig.savefig(path)
+    plt.close(fig)
+    return path
+
+
+PARETO_COLUMNS = [
+    ('name', 'Model', 's'),
+    ('input_size', 'Input', 'd'),
+    ('roi', 'ROI', 's'),
+    ('size_mb', 'Size (MB)', '.1f'),
+    ('mean_m', 'Mean err (m)', '.2f'),
+    ('median_m', 'Median err (m)', '.2f'),
+    ('p95_m', 'P95 err (m)', '.2f'),
+    ('latency_b1_ms', 'Latency b1 (ms)', '.2f'),
+    ('latency_b32_ms', 'Latency b32 (ms)', '.2f'),
+    ('images_per_s', 'Images/s b32', '.1f'),
+    ('front', 'Pareto', 's'),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Accuracy / latency / size benchmark over backbones and '
+                                                 'input resolutions, with the Pareto front.')
+    parser.add_argument('--backbones', type=lambda value: [name for name in value.split(',') if name],
+                        default=[], help='Comma separated torchvision backbones to train heads for '
+                                         '(e.g. efficientnet_b0,efficientnet_b4).')
+    parser.add_argument('--sizes', type=parse_widths, default=(224, 380),
+                        help='Comma separated input resolutions tried with every backbone.')
+    parser.add_argument('--models', type=str, nargs='*', default=[],
+                        help='Existing ONNX models to benchmark as well.')
+    parser.add_argument('--head-widths', type=parse_widths, default=(1024, 128, 64),
+                        help='Comma separated hidden layer widths of the trained heads.')
+    parser.add_argument('--no-pretrained', dest='pretrained', action='store_false',
+                        help='Use random backbone weights (only to test the pipeline).')
+    parser.add_argument('--csv', type=str, default='dataset.csv',
+                        help='CSV file with the labels.')
+    parser.add_argument('--root', type=str, default='./resizeDataSet',
+                        help='Folder containing the images.')
+    parser.add_argument('--cache-dir', type=str, default='feature_cache',
+                        help='Folder where the feature caches are stored.')
+    parser.add_argument('--dtype', type=str, default='float16', choices=list(DTYPES),
+                        help='Storage type of the cached features.')
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--lr', type=float, default=1e-2)
+    parser.add_argument('--epochs', type=int, default=50)
+    parser.add_argument('--patience', type=int, default=5)
+    parser.add_argument('--loss', type=str, default='l1', choices=list(LOSSES))
+    parser.add_argument('--seed', type=int, default=0,
+                        help='Seed of the train/validation split, every model is scored on the same validation images.')
+    parser.add_argument('--eval-batch-size', type=int, default=8,
+                        help='Batch size used for the error measurement.')
+    parser.add_argument('--latency-runs', type=int, default=20,
+                        help='Number of timed runs for each latency benchmark.')
+    parser.add_argument('--output-dir', type=str, default='pareto',
+                        help='Folder of the exported models, the results and the plot.')
+    add_roi_argument(parser)
+    add_engine_arguments(parser)
+    args = parser.parse_args()
+
+    if not args.backbones and not args.models:
+        parser.error('nothing to benchmark, give --backbones and/or --models')
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    engine_options = engine_options_from_args(args)
+    if args.io_binding:
+        engine_options['max_batch_size'] = max(engine_options['max_batch_size'], 32)
+
+    def validation_set(path):
+        # Each model at its own resolution and ROI, on the same split as train_head
+        # so the trained heads never see these images.
+        engine = InferenceEngine(path)
+        dataset = MyDataset(csv_file=args.csv, root_dir=args.root,
+                            transform=get_transform(engine.input_size or 380, engine.roi))
+        _, val_dataset = split_dataset(dataset, 0.3, args.seed)
+        return Subset(dataset, sorted(val_dataset.indices))
+
+    rows = []
+    for backbone in args.backbones:
+        for input_size in args.sizes:
+            name = f"{backbone}_{input_size}"
+            print(f"=== {name} ===")
+            torch.manual_seed(args.seed)
+            model = KartModel(backbone, args.head_widths, pretrained=args.pretrained)
+            path = get_feature_cache(name, args.csv, args.root, args.cache_dir, args.dtype,
+                                     device=device, model=model, input_size=input_size, roi=args.roi,
+                                     pretrained=args.pretrained)
+            train_head(model, FeatureDataset(path), args.batch_size, args.lr, args.epochs, args.patience,
+                       device, args.seed, args.loss)
+            exported = export_split(model, input_size, os.path.join(args.output_dir, name), device, args.roi)
+            rows.append(measure_model(name, exported['combined'], validation_set(exported['combined']), engine_options,
+                                      args.eval_batch_size, args.latency_runs))
+
+    for path in args.models:
+        rows.append(measure_model(os.path.splitext(os.path.basename(path))[0], path, validation_set(path),
+                                  engine_options, args.eval_batch_size, args.latency_runs))
+
+    pareto_front(rows)
+    rows.sort(key=lambda row: row['latency_b1_ms'])
+    for row in rows:
+        row['front'] = '*' if row['pareto'] else ''
+
+    print()
+    print(format_table(rows, PARETO_COLUMNS))
+
+    results_path = os.path.join(args.output_dir, 'pareto_results.json')
+    with open(results_path, 'w') as f:
+        json.dump(rows, f, indent=2)
+    print(f"Results written to {results_path}")
+    print(f"Plot written to {plot_pareto(rows, os.path.join(args.output_dir, 'pareto.png'))}")
+
+
+if __name__ == '__main__':
+    main()
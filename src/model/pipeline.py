@@ -0,0 +1,151 @@
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+_DONE = object()
+
+
+class StageTimer:
+    """Accumulates wall time per pipeline stage (thread safe)."""
+
+    def __init__(self):
+        self.totals = {}
+        self.counts = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage, seconds, count=1):
+        with self._lock:
+            self.totals[stage] = self.totals.get(stage, 0.0) + seconds
+            self.counts[stage] = self.counts.get(stage, 0) + count
+
+    def report(self, wall_time=None, file=None):
+        print("Stage timings:", file=file)
+        for stage, total in self.totals.items():
+            count = self.counts[stage]
+            print(f"  {stage:<12} total {total:9.3f} s | {1000.0 * total / max(count, 1):9.3f} ms per item ({count} items)", file=file)
+        if wall_time is not None:
+            print(f"  {'wall':<12} total {wall_time:9.3f} s", file=file)
+        # Decode runs in parallel workers; the consumer thread only sees the
+        # time it spent waiting on the queue, so compare consumer-side stages.
+        consumer = {stage: total for stage, total in self.totals.items() if stage != 'decode'}
+        if consumer:
+            bottleneck = max(consumer, key=consumer.get)
+            if bottleneck == 'wait':
+                print("Bottleneck stage : decode (the consumer is waiting on the prefetch queue)", file=file)
+            else:
+                print(f"Bottleneck stage : {bottleneck}", file=file)
+
+
+class PrefetchPipeline:
+    """
+    Bounded producer/consumer pipeline: a pool of workers decodes and resizes
+    frames into a prefetch queue while the caller drains it in batches.
+
+    load_fn: function item -> array/tensor for one frame.
+    collate_fn: function list of loaded frames -> batch.
+    workers: size of the decode pool (0 decodes in the calling thread).
+    queue_depth: maximum number of frames decoded ahead of the consumer.
+    batch_buffer: optional preallocated array (e.g. engine.input_buffer); batches
+        are then collated into its leading rows with collate_fn(loaded, out=...)
+        instead of a new array, and are only valid until the next batch.
+    """
+
+    def __init__(self, load_fn, collate_fn, workers=4, queue_depth=16, timer=None, batch_buffer=None):
+        if workers < 0:
+            raise ValueError("workers must be >= 0")
+        if queue_depth < 1:
+            raise ValueError("queue_depth must be >= 1")
+        self.load_fn = load_fn
+        self.collate_fn = collate_fn
+        self.workers = workers
+        self.queue_depth = queue_depth
+        self.timer = timer or StageTimer()
+        self.batch_buffer = batch_buffer
+
+    def _timed_load(self, item):
+        start = time.perf_counter()
+        loaded = self.load_fn(item)
+        self.timer.add('decode', time.perf_counter() - start)
+        return loaded
+
+    def _collate(self, items, loaded):
+        start = time.perf_counter()
+        if self.batch_buffer is not None:
+            batch = self.collate_fn(loaded, out=self.batch_buffer[:len(loaded)])
+        else:
+            batch = self.collate_fn(loaded)
+        self.timer.add('collate', time.perf_counter() - start, len(items))
+        return items, batch
+
+    def batches(self, items, batch_size):
+        """Yield (items, batch) tuples, preserving the input order."""
+        if self.workers == 0:
+            yield from self._serial_batches(items, batch_size)
+            return
+
+        pending = queue.Queue(maxsize=self.queue_depth)
+        stop = threading.Event()
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            def put(entry):
+                while not stop.is_set():
+                    try:
+                        pending.put(entry, timeout=0.1)
+                        return True
+                    except queue.Full:
+                        continue
+                return False
+
+            def produce():
+                for item in items:
+                    future = executor.submit(self._timed_load, item)
+                    if not put((item, future)):
+                        future.cancel()
+                        return
+                put(_DONE)
+
+            producer = threading.Thread(target=produce, daemon=True)
+            producer.start()
+
+            try:
+                batch_items, loaded = [], []
+                while True:
+                    start = time.perf_counter()
+                    entry = pending.get()
+                    if entry is _DONE:
+                        break
+                    item, future = entry
+                    frame = future.result()
+                    self.timer.add('wait', time.perf_counter() - start)
+
+                    batch_items.append(item)
+                    loaded.append(frame)
+                    if len(batch_items) == batch_size:
+                        yield self._collate(batch_items, loaded)
+                        batch_items, loaded = [], []
+
+                if batch_items:
+                    yield self._collate(batch_items, loaded)
+            finally:
+                stop.set()
+                # Drain so a blocked producer can observe the stop flag.
+                while True:
+                    try:
+                        entry = pending.get_nowait()
+                    except queue.Empty:
+                        break
+                    if entry is not _DONE:
+                        entry[1].cancel()
+                producer.join()
+
+    def _serial_batches(self, items, batch_size):
+        batch_items, loaded = [], []
+        for item in items:
+            batch_items.append(item)
+            loaded.append(self._timed_load(item))
+            if len(batch_items) == batch_size:
+                yield self._collate(batch_items, loaded)
+                batch_items, loaded = [], []
+        if batch_items:
+            yield self._collate(batch_items, loaded)
@@ -0,0 +1,26 @@
+import numpy as np
+from PIL import Image
+
+from src.utils.roi import RoiCrop
+
+
+class ToArray:
+    """
+    NumPy/PIL equivalent of T.Compose([T.Resize((size, size)), T.ToTensor()]):
+    bilinear PIL resize, HWC uint8 -> CHW float32 in [0, 1]. Produces the same
+    values as the torchvision transform without importing torch.
+    roi: (left, top, right, bottom) fractions cropped before the resize.
+    """
+
+    def __init__(self, size, roi=None):
+        self.size = size
+        self.crop = RoiCrop(roi)
+
+    def __call__(self, image, out=None):
+        image = self.crop(image).resize((self.size, self.size), Image.BILINEAR)
+        chw = np.asarray(image, dtype=np.uint8).transpose(2, 0, 1)
+        if out is None:
+            return chw.astype(np.float32) / np.float32(255.0)
+        # Write straight into a caller-provided float32 buffer.
+        np.divide(chw, np.float32(255.0), out=out, dtype=np.float32)
+        return out
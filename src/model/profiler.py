@@ -0,0 +1,169 @@
+import contextlib
+import csv
+import json
+import os
+import sys
+import time
+
+import torch
+
+from src.model.pipeline import StageTimer
+
+PHASES = ('data', 'forward', 'backward', 'optimizer')
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process in MB (None where resource is missing, e.g. Windows)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+class EnergyMeter:
+    """Energy per epoch from a codecarbon tracker, using its task API when the installed version has it."""
+
+    def __init__(self, tracker=None):
+        self.tracker = tracker if tracker is not None and hasattr(tracker, 'start_task') else None
+
+    def start(self, name):
+        if self.tracker is not None:
+            try:
+                self.tracker.start_task(name)
+            except Exception as e:
+                print(f"Energy per epoch disabled: {e}")
+                self.tracker = None
+
+    def stop(self):
+        if self.tracker is None:
+            return None
+        try:
+            return float(self.tracker.stop_task().energy_consumed)
+        except Exception as e:
+            print(f"Energy per epoch disabled: {e}")
+            self.tracker = None
+            return None
+
+
+class TrainingProfiler:
+    """
+    Wall time of the training phases (data wait, forward, backward, optimizer
+    step) per step and per epoch, with throughput, peak RSS and energy.
+
+    record_steps: keep one record per step in the run log (per-epoch totals are always kept).
+    tracker: codecarbon EmissionsTracker, for the energy per epoch.
+    profile_steps: (first, last) global step numbers traced with torch.profiler
+        into profile_dir (Chrome trace, open in chrome://tracing or Perfetto).
+    """
+
+    def __init__(self, record_steps=True, tracker=None, profile_steps=None, profile_dir='profiles', device=None):
+        self.record_steps = record_steps
+        self.energy = EnergyMeter(tracker)
+        self.profile_steps = profile_steps
+        self.profile_dir = profile_dir
+        self.synchronize = device is not None and torch.device(device).type == 'cuda'
+
+        self.epochs = []
+        self.steps = []
+        self.global_step = 0
+        self.timer = StageTimer()
+        self._current = {}
+        self._epoch_start = None
+        self._torch_profiler = None
+
+    def _now(self):
+        # CUDA kernels run asynchronously, wait for them so the phases are not misattributed.
+        if self.synchronize:
+            torch.cuda.synchronize()
+        return time.perf_counter()
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        start = self._now()
+        try:
+            yield
+        finally:
+            self.add(name, self._now() - start)
+
+    def add(self, name, seconds):
+        self._current[name] = self._current.get(name, 0.0) + seconds
+
+    def epoch_start(self, epoch):
+        self.timer = StageTimer()
+        self.energy.start(f"epoch_{epoch + 1}")
+        self._epoch_start = time.perf_counter()
+
+    def step_start(self):
+        if self.profile_steps is not None and self.global_step == self.profile_steps[0]:
+            os.makedirs(self.profile_dir, exist_ok=True)
+            self._torch_profiler = torch.profiler.profile(record_shapes=True, profile_memory=True)
+            self._torch_profiler.__enter__()
+
+    def step_end(self, batch_size):
+        for name, seconds in self._current.items():
+            self.timer.add(name, seconds, batch_size)
+        if self.record_steps:
+            self.steps.append({'step': self.global_step, 'epoch': len(self.epochs) + 1, 'images': batch_size,
+                               **{f'{name}_s': self._current.get(name, 0.0) for name in PHASES}})
+        self._current = {}
+        self.global_step += 1
+
+        if self._torch_profiler is not None and self.global_step > self.profile_steps[1]:
+            first, last = self.profile_steps
+            self._torch_profiler.__exit__(None, None, None)
+            path = os.path.join(self.profile_dir, f"trace_steps_{first}-{last}.json")
+            self._torch_profiler.export_chrome_trace(path)
+            print(f"  torch.profiler trace of steps {first}-{last} written to {path}")
+            self._torch_profiler = None
+
+    def epoch_end(self, epoch, train_loss, val_loss, validation_s=None):
+        wall = time.perf_counter() - self._epoch_start
+        images = self.timer.counts.get('forward', 0)
+        train_s = sum(self.timer.totals.get(name, 0.0) for name in PHASES)
+        record = {
+            'epoch': epoch + 1,
+            'train_loss': train_loss,
+            'val_loss': val_loss,
+            'wall_s': wall,
+            **{f'{name}_s': self.timer.totals.get(name, 0.0) for name in PHASES},
+            'validation_s': validation_s,
+            'images': images,
+            'images_per_s': images / train_s if train_s > 0 else None,
+            'peak_rss_mb': peak_rss_mb(),
+            'energy_kwh': self.energy.stop(),
+        }
+        self.epochs.append(record)
+        return record
+
+    def summary(self, record):
+        parts = [f"{name} {record[f'{name}_s']:.2f} s" for name in PHASES]
+        line = f"  Time: {' | '.join(parts)} | {record['images_per_s'] or 0:.1f} images/s"
+        if record['peak_rss_mb'] is not None:
+            line += f" | peak RSS {record['peak_rss_mb']:.0f} MB"
+        if record['energy_kwh'] is not None:
+            line += f" | {record['energy_kwh'] * 1000:.3f} Wh"
+        return line
+
+    def write(self, path, config=None):
+        """JSON (config, epochs and steps) or, for a .csv path, one row per epoch."""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if path.endswith('.csv'):
+            with open(path, 'w', newline='', encoding='utf-8') as f:
+                writer = csv.DictWriter(f, fieldnames=list(self.epochs[0]) if self.epochs else ['epoch'])
+                writer.writeheader()
+                writer.writerows(self.epochs)
+        else:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump({'config': config or {}, 'epochs': self.epochs, 'steps': self.steps}, f, indent=2)
+        return path
+
+
+def parse_step_range(value):
+    # "20-25" -> (20, 25), "30" -> (30, 30)
+    first, _, last = value.partition('-')
+    return int(first), int(last or first)
@@ -0,0 +1,144 @@
+import argparse
+import os
+import random
+
+from onnxruntime.quantization import (CalibrationDataReader, QuantFormat, QuantType,
+                                      quantize_dynamic, quantize_static)
+from torch.utils.data import Subset
+
+from src.dataset.dataset import MyDataset
+from src.model.engine import InferenceEngine, add_engine_arguments, benchmark_latency, engine_options_from_args
+from src.model.evaluate import evaluate_errors, get_transform
+from src.utils.geo import summarize_errors
+from src.utils.utils import format_table, model_size_mb
+
+
+class DatasetCalibrationReader(CalibrationDataReader):
+    """Feeds preprocessed MyDataset samples to the static quantization calibrator."""
+
+    def __init__(self, dataset, input_name):
+        self.dataset = dataset
+        self.input_name = input_name
+        self.index = 0
+
+    def get_next(self):
+        if self.index >= len(self.dataset):
+            return None
+        image, _ = self.dataset[self.index]
+        self.index += 1
+        return {self.input_name: image.unsqueeze(0).numpy()}
+
+    def rewind(self):
+        self.index = 0
+
+
+def quantize_model(fp32_model_path, output_prefix, calibration_dataset=None, per_channel=True):
+    """
+    Write dynamic and (when a calibration dataset is given) static INT8 variants
+    of an fp32 ONNX model. Returns a dict name -> path.
+    """
+    outputs = {}
+
+    dynamic_path = f"{output_prefix}_int8_dynamic.onnx"
+    quantize_dynamic(fp32_model_path, dynamic_path, weight_type=QuantType.QInt8, per_channel=per_channel)
+    outputs['int8-dynamic'] = dynamic_path
+
+    if calibration_dataset is not None:
+        input_name = InferenceEngine(fp32_model_path).input_name
+        static_path = f"{output_prefix}_int8_static.onnx"
+        # The models are exported with opset 12, per-channel QDQ needs opset 13,
+        # so use the QLinearConv/QLinearMatMul operator format.
+        quantize_static(fp32_model_path, static_path,
+                        DatasetCalibrationReader(calibration_dataset, input_name),
+                        quant_format=QuantFormat.QOperator,
+                        activation_type=QuantType.QUInt8,
+                        weight_type=QuantType.QInt8,
+                        per_channel=per_channel)
+        outputs['int8-static'] = static_path
+
+    return outputs
+
+
+def compare_models(models, dataset, engine_options=None, batch_size=1, latency_runs=20):
+    """Measure error (metres) and CPU latency for each (name, path), returns table rows."""
+    rows = []
+    for name, path in models:
+        engine = InferenceEngine(path, **(engine_options or {}))
+        summary = summarize_errors(evaluate_errors(engine, dataset, batch_size=batch_size, verbose=False))
+        latency = benchmark_latency(engine, batch_size=1, runs=latency_runs)
+        rows.append({
+            'name': name,
+            'size_mb': model_size_mb(path),
+            **summary,
+            'latency_ms': latency['mean_ms'],
+            'p95_latency_ms': latency['p95_ms'],
+            'images_per_s': latency['images_per_s'],
+        })
+        print(f"Measured {name} ({path})")
+    return rows
+
+
+COMPARISON_COLUMNS = [
+    ('name', 'Model', 's'),
+    ('size_mb', 'Size (MB)', '.1f'),
+    ('mean_m', 'Mean err (m)', '.2f'),
+    ('median_m', 'Median err (m)', '.2f'),
+    ('p95_m', 'P95 err (m)', '.2f'),
+    ('latency_ms', 'Latency b1 (ms)', '.2f'),
+    ('p95_latency_ms', 'P95 latency (ms)', '.2f'),
+    ('images_per_s', 'Images/s', '.1f'),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Quantize an exported ONNX model to INT8 and compare it to fp32.')
+    parser.add_argument('--model', type=str, default='kart_efficientb4.onnx',
+                        help='Path to the fp32 ONNX model file.')
+    parser.add_argument('--csv', type=str, default='dataset.csv',
+                        help='CSV file with the labels.')
+    parser.add_argument('--root', type=str, default='./resizeDataSet',
+                        help='Folder containing the images.')
+    parser.add_argument('--calibration-samples', type=int, default=200,
+                        help='Number of MyDataset samples used for static calibration (0 = dynamic only).')
+    parser.add_argument('--eval-samples', type=int, default=None,
+                        help='Number of samples used for the error measurement (default: all).')
+    parser.add_argument('--batch-size', type=int, default=8,
+                        help='Batch size used for the error measurement.')
+    parser.add_argument('--latency-runs', type=int, default=20,
+                        help='Number of timed runs for the latency benchmark.')
+    parser.add_argument('--per-tensor', action='store_true',
+                        help='Quantize weights per tensor instead of per channel.')
+    parser.add_argument('--seed', type=int, default=0)
+    add_engine_arguments(parser)
+    args = parser.parse_args()
+
+    engine = InferenceEngine(args.model)
+    dataset = MyDataset(csv_file=args.csv, root_dir=args.root,
+                        transform=get_transform(engine.input_size or 380, engine.roi))
+
+    # Calibration and evaluation samples are disjoint so the static model is
+    # not scored on the frames it was calibrated on.
+    indices = list(range(len(dataset)))
+    random.Random(args.seed).shuffle(indices)
+    calibration_indices = indices[:args.calibration_samples]
+    evaluation_indices = indices[args.calibration_samples:]
+    if args.eval_samples is not None:
+        evaluation_indices = evaluation_indices[:args.eval_samples]
+
+    calibration = Subset(dataset, sorted(calibration_indices)) if calibration_indices else None
+    evaluation = Subset(dataset, sorted(evaluation_indices))
+
+    output_prefix = os.path.splitext(args.model)[0]
+    quantized = quantize_model(args.model, output_prefix, calibration, per_channel=not args.per_tensor)
+    for name, path in quantized.items():
+        print(f"{name} model written to {path}")
+
+    rows = compare_models([('fp32', args.model)] + list(quantized.items()), evaluation,
+                          engine_options_from_args(args), batch_size=args.batch_size, latency_runs=args.latency_runs)
+
+    print()
+    print(format_table(rows, COMPARISON_COLUMNS))
+
+
+if __name__ == '__main__':
+    main()
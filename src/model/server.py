@@ -0,0 +1,238 @@
+import argparse
+import asyncio
+import io
+import json
+import time
+from collections import deque
+
+import numpy as np
+from PIL import Image
+
+from src.model.engine import add_engine_arguments, engine_from_args, to_coordinates
+from src.model.infer import get_transform
+
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+           413: 'Payload Too Large', 500: 'Internal Server Error', 503: 'Service Unavailable'}
+
+
+class LatencyStats:
+    """Keeps the last `window` request latencies and reports percentiles."""
+
+    def __init__(self, window=10000):
+        self.latencies = deque(maxlen=window)
+        self.batch_sizes = deque(maxlen=window)
+        self.requests = 0
+        self.errors = 0
+
+    def add(self, seconds):
+        self.requests += 1
+        self.latencies.append(seconds * 1000.0)
+
+    def summary(self):
+        result = {'requests': self.requests, 'errors': self.errors}
+        if self.latencies:
+            latencies = np.array(self.latencies)
+            for p in (50, 90, 95, 99):
+                result[f'p{p}_ms'] = float(np.percentile(latencies, p))
+            result['mean_ms'] = float(np.mean(latencies))
+        if self.batch_sizes:
+            result['mean_batch_size'] = float(np.mean(self.batch_sizes))
+        return result
+
+
+class MicroBatcher:
+    """
+    Coalesces concurrent single-frame requests into micro-batches. A batch is
+    sent to the model as soon as it holds max_batch_size frames or the oldest
+    frame has waited max_wait_ms.
+    """
+
+    def __init__(self, engine, max_batch_size=8, max_wait_ms=5.0, max_queue_size=256):
+        self.engine = engine
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.queue = asyncio.Queue(maxsize=max_queue_size)
+        self.stats = LatencyStats()
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def predict(self, image_array):
+        future = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait((image_array, future))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            input_data = np.concatenate([image for image, _ in batch])
+            self.stats.batch_sizes.append(len(batch))
+            try:
+                # session.run releases the GIL, keep the event loop responsive.
+                predictions = await loop.run_in_executor(None, self.engine.run, input_data)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            for (_, future), prediction in zip(batch, predictions):
+                if not future.done():
+                    future.set_result(to_coordinates(prediction))
+
+
+class PredictionServer:
+    """
+    Minimal HTTP/1.1 server (keep-alive, Content-Length bodies only):
+      POST /predict  body = encoded image (PNG/JPEG), returns {"lat", "lon"}
+      GET  /stats    latency percentiles, queue depth and batch sizes
+      GET  /health
+    """
+
+    def __init__(self, batcher, max_body_size=20 * 1024 * 1024):
+        self.batcher = batcher
+        self.transform = get_transform(batcher.engine.input_size or 380, batcher.engine.roi)
+        self.max_body_size = max_body_size
+
+    def preprocess(self, body):
+        image = Image.open(io.BytesIO(body)).convert('RGB')
+        return self.transform(image)[np.newaxis]
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode('latin-1').split(' ', 2)
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                length = int(headers.get('content-length', 0))
+                if length > self.max_body_size:
+                    await self.respond(writer, 413, {'error': 'body too large'}, keep_alive=False)
+                    break
+                body = await reader.readexactly(length) if length else b''
+
+                status, payload = await self.route(method, path, body)
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                await self.respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def route(self, method, path, body):
+        if path == '/health':
+            return 200, {'status': 'ok'}
+        if path == '/stats':
+            return 200, {**self.batcher.stats.summary(), 'queue_depth': self.batcher.queue.qsize()}
+        if path != '/predict':
+            return 404, {'error': f'unknown path {path}'}
+        if method != 'POST':
+            return 405, {'error': 'use POST'}
+
+        start = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            image_array = await loop.run_in_executor(None, self.preprocess, body)
+        except Exception as e:
+            self.batcher.stats.errors += 1
+            return 400, {'error': f'could not decode image: {e}'}
+        try:
+            lat, lon = await self.batcher.predict(image_array)
+        except asyncio.QueueFull:
+            self.batcher.stats.errors += 1
+            return 503, {'error': 'queue full'}
+        except Exception as e:
+            self.batcher.stats.errors += 1
+            return 500, {'error': str(e)}
+        self.batcher.stats.add(time.perf_counter() - start)
+        return 200, {'lat': lat, 'lon': lon}
+
+    async def respond(self, writer, status, payload, keep_alive=True):
+        body = json.dumps(payload).encode('utf-8')
+        head = (f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+                f"Content-Type: application/json\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+        writer.write(head.encode('latin-1') + body)
+        await writer.drain()
+
+
+async def serve(engine, host='127.0.0.1', port=8000, unix_socket=None, max_batch_size=8, max_wait_ms=5.0,
+                max_queue_size=256):
+    batcher = MicroBatcher(engine, max_batch_size, max_wait_ms, max_queue_size)
+    batcher.start()
+    server = PredictionServer(batcher)
+
+    if unix_socket is not None:
+        tcp_server = await asyncio.start_unix_server(server.handle, path=unix_socket)
+        print(f"Serving on unix socket {unix_socket}")
+    else:
+        tcp_server = await asyncio.start_server(server.handle, host, port)
+        print(f"Serving on http://{host}:{port}")
+
+    try:
+        async with tcp_server:
+            await tcp_server.serve_forever()
+    finally:
+        await batcher.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local prediction server with micro-batching.')
+    parser.add_argument('--model', type=str, default='kart_efficientb4.onnx',
+                        help='Path to the ONNX model file.')
+    parser.add_argument('--host', type=str, default='127.0.0.1',
+                        help='Address to listen on (local only by default).')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--unix-socket', type=str, default=None,
+                        help='Listen on a Unix socket instead of TCP.')
+    parser.add_argument('--max-batch-size', type=int, default=8,
+                        help='Maximum number of frames per model run.')
+    parser.add_argument('--max-wait-ms', type=float, default=5.0,
+                        help='Maximum time a frame waits for a batch to fill.')
+    parser.add_argument('--max-queue-size', type=int, default=256,
+                        help='Requests beyond this queue depth are rejected with 503.')
+    add_engine_arguments(parser)
+    args = parser.parse_args()
+
+    engine = engine_from_args(args)
+    try:
+        asyncio.run(serve(engine, args.host, args.port, args.unix_socket, args.max_batch_size,
+                          args.max_wait_ms, args.max_queue_size))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+import argparse
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import numpy as np
+
+from src.utils.utils import format_table
+
+# Previous infer.py path: torch/torchvision preprocessing, then .numpy() for onnxruntime.
+TORCH_SNIPPET = '''
+import sys
+import onnxruntime as ort
+import torchvision.transforms as T
+from PIL import Image
+session = ort.InferenceSession(sys.argv[1], providers=['CPUExecutionProvider'])
+size = session.get_inputs()[0].shape[-1]
+transform = T.Compose([T.Resize((size, size)), T.ToTensor()])
+input_data = transform(Image.open(sys.argv[2]).convert('RGB')).unsqueeze(0).numpy()
+print(session.run(None, {session.get_inputs()[0].name: input_data})[0][0])
+'''
+
+NUMPY_SNIPPET = '''
+import sys
+from src.model.engine import InferenceEngine
+from src.model.infer import get_transform, load_image
+engine = InferenceEngine(sys.argv[1])
+input_data = load_image(sys.argv[2], get_transform(engine.input_size or 380, engine.roi))
+print(engine.run(input_data)[0])
+assert 'torch' not in sys.modules, 'torch was imported'
+'''
+
+
+def measure(snippet, model, image, cwd):
+    """Run the snippet in a fresh interpreter, returns (seconds, peak RSS in MB, stdout)."""
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, '-c', snippet, model, image], cwd=cwd,
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    # Both pipes are drained while waiting: a child writing more than a pipe
+    # buffer (warnings, a traceback) would otherwise block forever.
+    outputs = {}
+
+    def drain(name, pipe):
+        outputs[name] = pipe.read()
+
+    readers = [threading.Thread(target=drain, args=(name, pipe))
+               for name, pipe in (('stdout', process.stdout), ('stderr', process.stderr))]
+    for reader in readers:
+        reader.start()
+    # wait4 gives the resource usage of this child only.
+    _, status, usage = os.wait4(process.pid, 0)
+    elapsed = time.perf_counter() - start
+    for reader in readers:
+        reader.join()
+    stdout, stderr = outputs['stdout'], outputs['stderr']
+    process.returncode = os.waitstatus_to_exitcode(status)
+    if process.returncode != 0:
+        raise RuntimeError(f"Benchmark process failed:\n{stderr}")
+    # ru_maxrss is in KB on Linux.
+    return elapsed, usage.ru_maxrss / 1024.0, stdout.strip()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare startup time and peak memory of torch and NumPy preprocessing.')
+    parser.add_argument('--model', type=str, default='kart_efficientb4.onnx',
+                        help='Path to the ONNX model file.')
+    parser.add_argument('--image', type=str, required=True,
+                        help='Path to the input image.')
+    parser.add_argument('--runs', type=int, default=5,
+                        help='Number of fresh processes per variant.')
+    args = parser.parse_args()
+
+    root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    model = os.path.abspath(args.model)
+    image = os.path.abspath(args.image)
+
+    rows = []
+    outputs = {}
+    for name, snippet in (('torch + torchvision', TORCH_SNIPPET), ('numpy + PIL', NUMPY_SNIPPET)):
+        timings, memory = [], []
+        for _ in range(args.runs):
+            elapsed, peak_rss, stdout = measure(snippet, model, image, root)
+            timings.append(elapsed)
+            memory.append(peak_rss)
+        outputs[name] = stdout
+        rows.append({
+            'name': name,
+            'startup_s': float(np.mean(timings)),
+            'startup_min_s': float(np.min(timings)),
+            'peak_rss_mb': float(np.max(memory)),
+        })
+
+    print(format_table(rows, [
+        ('name', 'Runtime', 's'),
+        ('startup_s', 'Mean time to first prediction (s)', '.3f'),
+        ('startup_min_s', 'Min (s)', '.3f'),
+        ('peak_rss_mb', 'Peak RSS (MB)', '.1f'),
+    ]))
+    print("Predictions:")
+    for name, stdout in outputs.items():
+        print(f"  {name}: {stdout}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+import argparse
+import csv
+import json
+import sys
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from src.model.engine import add_engine_arguments, engine_from_args, to_coordinates
+from src.model.infer import get_transform, run_inference
+from src.model.pipeline import PrefetchPipeline, StageTimer
+from src.utils.chrono import Chrono
+
+
+def iter_video_frames(video_path, every=1, decode=None):
+    """
+    Decode a video lazily and yield (frame_index, timestamp, frame) for every
+    k-th frame. The generator itself only holds one decoded frame.
+
+    decode: optional function frame_index -> bool. When given, every frame is
+    yielded and frame is None for the frames it did not ask to decode.
+    """
+    if every < 1:
+        raise ValueError("every must be >= 1")
+
+    capture = cv2.VideoCapture(video_path)
+    if not capture.isOpened():
+        raise ValueError(f"Could not open video {video_path}")
+
+    fps = capture.get(cv2.CAP_PROP_FPS) or 0.0
+    frame_index = 0
+    try:
+        while True:
+            wanted = decode(frame_index) if decode is not None else frame_index % every == 0
+            if not wanted:
+                # grab() advances without converting the frame to BGR.
+                if not capture.grab():
+                    break
+                if decode is not None:
+                    yield frame_index, video_timestamp(capture, frame_index, fps), None
+                frame_index += 1
+                continue
+
+            ok, frame = capture.read()
+            if not ok:
+                break
+            yield frame_index, video_timestamp(capture, frame_index, fps), frame
+            frame_index += 1
+    finally:
+        capture.release()
+
+
+def video_timestamp(capture, frame_index, fps):
+    return frame_index / fps if fps > 0 else capture.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
+
+
+def video_fps(video_path):
+    capture = cv2.VideoCapture(video_path)
+    try:
+        return capture.get(cv2.CAP_PROP_FPS) or 0.0
+    finally:
+        capture.release()
+
+
+def frame_to_array(frame, transform):
+    # OpenCV decodes to BGR, the model was trained on RGB PIL images.
+    image = Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+    return transform(image)[np.newaxis]
+
+
+def stream_predictions(engine, video_path, every=1, batch_size=1, workers=2, queue_depth=8, timer=None):
+    """Yield (frame_index, timestamp, lat, lon) records as the video is decoded."""
+    transform = get_transform(engine.input_size or 380, engine.roi)
+    pipeline = PrefetchPipeline(lambda entry: frame_to_array(entry[2], transform), np.concatenate,
+                                workers=workers, queue_depth=queue_depth, timer=timer,
+                                batch_buffer=engine.input_buffer)
+    chrono = Chrono()
+
+    for entries, input_data in pipeline.batches(iter_video_frames(video_path, every), batch_size):
+        chrono.start()
+        predictions = run_inference(engine, input_data)
+        pipeline.timer.add('inference', chrono.stop(), len(entries))
+
+        for (frame_index, timestamp, _), prediction in zip(entries, predictions):
+            lat, lon = to_coordinates(prediction)
+            yield frame_index, timestamp, lat, lon
+
+
+class RecordWriter:
+    """Writes records as they arrive, as CSV rows or one JSON object per line."""
+
+    FIELDS = ('frame_index', 'timestamp', 'lat', 'lon')
+    FORMATS = {'timestamp': '.3f', 'lat': '.8f', 'lon': '.8f', 'error_m': '.3f'}
+
+    def __init__(self, output, fmt='csv', fields=FIELDS):
+        if fmt not in ('csv', 'json'):
+            raise ValueError(f"Unknown output format: {fmt}")
+        self.fmt = fmt
+        self.fields = fields
+        self.file = sys.stdout if output in (None, '-') else open(output, 'w', newline='', encoding='utf-8')
+        if fmt == 'csv':
+            self.writer = csv.writer(self.file)
+            self.writer.writerow(fields)
+
+    def write(self, record):
+        if self.fmt == 'csv':
+            self.writer.writerow([format(value, self.FORMATS[field]) if field in self.FORMATS and value is not None
+                                  else value for field, value in zip(self.fields, record)])
+        else:
+            self.file.write(json.dumps(dict(zip(self.fields, record))) + "\n")
+        self.file.flush()
+
+    def close(self):
+        if self.file is not sys.stdout:
+            self.file.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Stream coordinates from an onboard video with an ONNX model.')
+    parser.add_argument('--model', type=str, default='kart_efficientb4.onnx',
+                        help='Path to the ONNX model file.')
+    parser.add_argument('--video', type=str, required=True,
+                        help='Path to the .mp4 video.')
+    parser.add_argument('--every', type=int, default=1,
+                        help='Run the model on every k-th frame.')
+    parser.add_argument('--batch-size', type=int, default=1,
+                        help='Number of frames sent to the model per run.')
+    parser.add_argument('--workers', type=int, default=2,
+                        help='Preprocessing worker threads (0 = serial).')
+    parser.add_argument('--queue-depth', type=int, default=8,
+                        help='Maximum number of frames decoded ahead of the model.')
+    parser.add_argument('--format', type=str, default='csv', choices=['csv', 'json'],
+                        help='Output format (json writes one object per line).')
+    parser.add_argument('--output', type=str, default='-',
+                        help='Output file, "-" for stdout.')
+    add_engine_arguments(parser)
+    args = parser.parse_args()
+
+    engine = engine_from_args(args)
+    writer = RecordWriter(args.output, args.format)
+    timer = StageTimer()
+
+    chrono = Chrono()
+    chrono.start()
+    count = 0
+    try:
+        for record in stream_predictions(engine, args.video, every=args.every, batch_size=args.batch_size,
+                                         workers=args.workers, queue_depth=args.queue_depth, timer=timer):
+            writer.write(record)
+            count += 1
+    finally:
+        writer.close()
+
+    time_total = chrono.stop()
+    # Keep stdout clean for the records.
+    if count:
+        print(f"Processed {count} frames in {time_total:.2f} s ({count / time_total:.2f} frames/s)",
+              file=sys.stderr)
+        timer.report(time_total, file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,215 @@
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import torch
+from torch.utils.data import DataLoader
+
+from src.model.engine import to_coordinates
+from src.model.export import export_onnx
+from src.model.feature_cache import DTYPES, FeatureDataset, get_feature_cache
+from src.model.networks import ARCHITECTURES, make_head
+from src.model.train import LOSSES, Trainer, split_dataset
+from src.utils.geo import haversine_distances
+from src.utils.roi import add_roi_argument
+from src.utils.utils import format_table
+
+DEFAULT_SPACE = {
+    'lr': [1e-2, 1e-3, 1e-4],
+    'head_widths': [[1024, 128, 64], [512, 64], [256]],
+    'loss': ['l1', 'mse'],
+    'patience': [5],
+    'batch_size': [32],
+}
+
+
+def expand_space(space, trials=None, seed=0):
+    """Grid of every combination of the space values, or `trials` of them drawn at random."""
+    keys = list(space)
+    grid = [dict(zip(keys, values)) for values in itertools.product(*(space[key] for key in keys))]
+    if trials is not None and trials < len(grid):
+        grid = random.Random(seed).sample(grid, trials)
+    return grid
+
+
+class MedianPruner:
+    """
+    Stops a trial when, after warmup_epochs, its best validation error so far is
+    worse than the median of what the other trials had reached at the same
+    epoch. The reports live in a multiprocessing.Manager dict shared by all
+    worker processes.
+    """
+
+    def __init__(self, reports, lock, warmup_epochs=3, min_trials=3):
+        self.reports = reports
+        self.lock = lock
+        self.warmup_epochs = warmup_epochs
+        self.min_trials = min_trials
+
+    def report(self, epoch, value):
+        """Record a trial's best value at `epoch`, returns True if it should be pruned."""
+        with self.lock:
+            others = self.reports.get(epoch, [])
+            self.reports[epoch] = others + [value]
+        if epoch < self.warmup_epochs or len(others) < self.min_trials:
+            return False
+        return value > float(np.median(others))
+
+
+def validation_error(head, loader):
+    """Mean distance in metres between predicted and true positions."""
+    head.eval()
+    predicted, expected = [], []
+    with torch.no_grad():
+        for features, labels in loader:
+            predicted += [to_coordinates(p) for p in head(features).numpy()]
+            expected += [to_coordinates(label) for label in labels.numpy()]
+    return float(np.mean(haversine_distances(np.array(predicted), np.array(expected))))
+
+
+def run_trial(trial_id, params, cache_path, feature_size, epochs, seed, pruner, threads):
+    torch.set_num_threads(threads)
+    torch.manual_seed(seed)
+    start = time.perf_counter()
+
+    # Every trial uses the same split, so their validation errors are comparable.
+    train_dataset, val_dataset = split_dataset(FeatureDataset(cache_path), 0.3, seed)
+    train_loader = DataLoader(train_dataset, batch_size=params['batch_size'], shuffle=True,
+                              generator=torch.Generator().manual_seed(seed))
+    val_loader = DataLoader(val_dataset, batch_size=256, shuffle=False)
+
+    head = make_head(feature_size, params['head_widths'])
+    trainer = Trainer(head, head, train_loader, val_loader, params['loss'], params['lr'])
+
+    state = {'best_error': float('inf'), 'pruned': False}
+
+    def on_epoch_end(trainer, epoch, val_loss):
+        # The losses differ between L1 and MSE, compare trials in metres.
+        state['best_error'] = min(state['best_error'], validation_error(head, val_loader))
+        if pruner.report(epoch, state['best_error']):
+            state['pruned'] = True
+        return state['pruned']
+
+    trainer.fit(epochs, params['patience'], on_epoch_end=on_epoch_end, verbose=False)
+
+    return {
+        'trial': trial_id,
+        **params,
+        'epochs_run': trainer.epoch,
+        'pruned': state['pruned'],
+        'val_error_m': validation_error(head, val_loader),
+        'time_s': time.perf_counter() - start,
+        'head': head.state_dict(),
+    }
+
+
+SWEEP_COLUMNS = [
+    ('rank', 'Rank', 'd'),
+    ('trial', 'Trial', 'd'),
+    ('lr', 'lr', 'g'),
+    ('widths', 'Head widths', 's'),
+    ('loss', 'Loss', 's'),
+    ('patience', 'Patience', 'd'),
+    ('batch_size', 'Batch', 'd'),
+    ('epochs_run', 'Epochs', 'd'),
+    ('status', 'Status', 's'),
+    ('val_error_m', 'Val err (m)', '.2f'),
+    ('time_s', 'Time (s)', '.1f'),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Hyperparameter sweep of the regression head on cached features.')
+    parser.add_argument('--arch', type=str, default='b4', choices=list(ARCHITECTURES),
+                        help='Model architecture.')
+    parser.add_argument('--csv', type=str, default='dataset.csv',
+                        help='CSV file with the labels.')
+    parser.add_argument('--root', type=str, default='./resizeDataSet',
+                        help='Folder containing the images.')
+    parser.add_argument('--cache-dir', type=str, default='feature_cache',
+                        help='Folder where the feature caches are stored.')
+    parser.add_argument('--dtype', type=str, default='float16', choices=list(DTYPES),
+                        help='Storage type of the cached features.')
+    parser.add_argument('--space', type=str, default=None,
+                        help='JSON file mapping lr, head_widths, loss, patience, batch_size to lists of values '
+                             '(missing keys use the defaults).')
+    parser.add_argument('--trials', type=int, default=None,
+                        help='Number of combinations drawn at random from the space (default: the full grid).')
+    parser.add_argument('--epochs', type=int, default=50)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='Trials run in parallel.')
+    parser.add_argument('--warmup-epochs', type=int, default=3,
+                        help='Epochs before a trial can be pruned.')
+    parser.add_argument('--min-trials', type=int, default=3,
+                        help='Reports needed at an epoch before pruning against their median.')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--results', type=str, default='sweep_results.json',
+                        help='Where to write every trial result.')
+    parser.add_argument('--output-prefix', type=str, default=None,
+                        help='The best head is exported to {prefix}_head.onnx (default: the architecture name).')
+    add_roi_argument(parser)
+    args = parser.parse_args()
+
+    space = dict(DEFAULT_SPACE)
+    if args.space is not None:
+        with open(args.space, 'r') as f:
+            space.update(json.load(f))
+    unknown = set(space) - set(DEFAULT_SPACE)
+    if unknown:
+        parser.error(f"unknown keys in the search space: {', '.join(sorted(unknown))}")
+    for loss in space['loss']:
+        if loss not in LOSSES:
+            parser.error(f"unknown loss {loss}")
+    trials = expand_space(space, args.trials, args.seed)
+
+    model_class = ARCHITECTURES[args.arch]
+    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    cache_path = get_feature_cache(args.arch, args.csv, args.root, args.cache_dir, args.dtype, device=device,
+                                   roi=args.roi)
+
+    workers = max(1, min(args.workers, len(trials)))
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    print(f"Running {len(trials)} trials with {workers} workers")
+
+    with multiprocessing.Manager() as manager:
+        pruner = MedianPruner(manager.dict(), manager.Lock(), args.warmup_epochs, args.min_trials)
+        results = []
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(run_trial, trial_id, params, cache_path, model_class.feature_size,
+                                       args.epochs, args.seed, pruner, threads)
+                       for trial_id, params in enumerate(trials)]
+            for future in as_completed(futures):
+                result = future.result()
+                results.append(result)
+                print(f"Trial {result['trial']} {'pruned' if result['pruned'] else 'done'} after "
+                      f"{result['epochs_run']} epochs: {result['val_error_m']:.2f} m")
+
+    results.sort(key=lambda result: result['val_error_m'])
+    for rank, result in enumerate(results, start=1):
+        result['rank'] = rank
+        result['widths'] = ','.join(str(width) for width in result['head_widths'])
+        result['status'] = 'pruned' if result['pruned'] else 'done'
+
+    print()
+    print(format_table(results, SWEEP_COLUMNS))
+
+    with open(args.results, 'w') as f:
+        json.dump([{key: value for key, value in result.items() if key != 'head'} for result in results], f, indent=2)
+    print(f"Results written to {args.results}")
+
+    best = results[0]
+    head = make_head(model_class.feature_size, best['head_widths'])
+    head.load_state_dict(best['head'])
+    path = export_onnx(head, torch.randn(1, model_class.feature_size),
+                       f"{args.output_prefix or model_class.export_name}_head.onnx", input_name='features')
+    print(f"Best head (trial {best['trial']}) has been exported to {path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,584 @@
+import argparse
+import contextlib
+import glob
+import hashlib
+import itertools
+import json
+import os
+import random
+import socket
+import time
+
+import numpy as np
+import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
+import torch.nn as nn
+import torch.optim as optim
+from torch.nn.parallel import DistributedDataParallel
+from torch.utils.data import Subset, random_split
+from torch.utils.data.distributed import DistributedSampler
+
+from src.dataset.loader import add_loader_arguments, loader_options_from_args, make_dataset, make_loader
+from src.model.export import export_split
+from src.model.networks import ARCHITECTURES, KartModel, parse_widths
+from src.model.profiler import TrainingProfiler, parse_step_range
+from src.utils.chrono import Chrono
+from src.utils.roi import format_roi
+
+LOSSES = {
+    'l1': nn.L1Loss,
+    'mse': nn.MSELoss,
+}
+
+
+def head_state_dict(head):
+    # Only the trainable weights, a few MB instead of the whole backbone.
+    return {name: value.detach().clone() for name, value in head.state_dict().items()}
+
+
+def rng_state():
+    state = {'python': random.getstate(), 'numpy': np.random.get_state(), 'torch': torch.get_rng_state()}
+    if torch.cuda.is_available():
+        state['cuda'] = torch.cuda.get_rng_state_all()
+    return state
+
+
+def set_rng_state(state):
+    random.setstate(state['python'])
+    np.random.set_state(state['numpy'])
+    torch.set_rng_state(state['torch'])
+    if 'cuda' in state and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(state['cuda'])
+
+
+# Options that define a run: --resume only continues a run made with the same ones.
+RUN_KEYS = ('arch', 'backbone', 'input_size', 'head_widths', 'pretrained', 'csv', 'subset', 'roi', 'loss', 'lr',
+            'batch_size', 'accumulation_steps', 'val_fraction', 'seed')
+
+
+def run_key(args):
+    config = {key: getattr(args, key, None) for key in RUN_KEYS}
+    return hashlib.sha256(json.dumps(config, sort_keys=True, default=str).encode()).hexdigest()[:12]
+
+
+def new_run_dir(checkpoint_dir, key):
+    """Create checkpoint_dir/run_<date-time>_<key>, the checkpoint folder of a new run."""
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    stamp = time.strftime('%Y%m%d-%H%M%S')
+    for number in itertools.count():
+        path = os.path.join(checkpoint_dir, f"run_{stamp}{f'-{number}' if number else ''}_{key}")
+        try:
+            os.mkdir(path)
+            return path
+        except FileExistsError:
+            continue
+
+
+def checkpoint_epoch(path):
+    return int(os.path.basename(path)[len('checkpoint_epoch'):-len('.pth')])
+
+
+def list_checkpoints(run_dir):
+    return sorted(glob.glob(os.path.join(run_dir, 'checkpoint_epoch*.pth')), key=checkpoint_epoch)
+
+
+def save_checkpoint(state, run_dir, epoch, keep=3):
+    """
+    Write checkpoint_epochNNNN.pth atomically (temporary file + os.replace) and
+    only keep the `keep` last epochs of the run. run_dir holds a single run
+    (new_run_dir), so epoch numbers never collide with an older run.
+    """
+    if keep < 1:
+        raise ValueError("keep must be >= 1")
+    os.makedirs(run_dir, exist_ok=True)
+    path = os.path.join(run_dir, f"checkpoint_epoch{epoch:04d}.pth")
+    # One temporary name per writer: in a folder shared by several nodes, each
+    # replaces the checkpoint with the same content.
+    tmp_path = f"{path}.{socket.gethostname()}.{os.getpid()}.tmp"
+    torch.save(state, tmp_path)
+    os.replace(tmp_path, path)
+
+    for old_path in list_checkpoints(run_dir)[:-keep]:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(old_path)
+    return path
+
+
+def latest_checkpoint(checkpoint_dir, key):
+    """Last epoch of the run with this run_key whose checkpoint was written most recently, or None."""
+    latest, latest_mtime = None, None
+    for run_dir in glob.glob(os.path.join(checkpoint_dir, f"run_*_{key}")):
+        paths = list_checkpoints(run_dir)
+        if not paths:
+            continue
+        mtime = os.path.getmtime(paths[-1])
+        if latest is None or mtime > latest_mtime:
+            latest, latest_mtime = paths[-1], mtime
+    return latest
+
+
+def load_checkpoint(path):
+    # Our own files: they hold RNG states (tuples, numpy arrays), not only tensors.
+    return torch.load(path, map_location='cpu', weights_only=False)
+
+
+class Trainer:
+    """
+    Trains `head` (model.classifier, or the model itself when training on cached
+    features) with early stopping on the validation loss.
+
+    loss: a LOSSES name, or a module called as loss(outputs, targets).
+    bf16: bfloat16 autocast for the forward pass (CPU and CUDA).
+    channels_last: NHWC memory format for the model and the image batches.
+    compile: run the forward pass through torch.compile.
+    accumulation_steps: number of batches whose gradients are summed before an
+        optimizer step (effective batch = batch_size * accumulation_steps).
+    profiler: TrainingProfiler recording the data/forward/backward/optimizer time
+        of every step (a per-epoch-only one is created by default).
+
+    When torch.distributed is initialised, the model is wrapped in
+    DistributedDataParallel (gradients are all-reduced), the losses are
+    averaged over all processes and only rank 0 prints and writes files, except
+    the checkpoints: saves_checkpoints (by default rank 0) is set on the first
+    process of every node, so each node can resume from its own disk.
+    """
+
+    def __init__(self, model, head, train_loader, val_loader, loss='l1', lr=1e-2, device='cpu',
+                 bf16=False, channels_last=False, compile=False, accumulation_steps=1, profiler=None,
+                 saves_checkpoints=None):
+        if accumulation_steps < 1:
+            raise ValueError("accumulation_steps must be >= 1")
+        self.device = torch.device(device)
+        self.model = model.to(self.device)
+        self.head = head
+        self.train_loader = train_loader
+        self.val_loader = val_loader
+        self.criterion = LOSSES[loss]() if isinstance(loss, str) else loss
+        self.optimizer = optim.Adam(head.parameters(), lr=lr)
+        self.bf16 = bf16
+        self.channels_last = channels_last
+        self.accumulation_steps = accumulation_steps
+        self.profiler = profiler or TrainingProfiler(record_steps=False)
+
+        if channels_last:
+            self.model = self.model.to(memory_format=torch.channels_last)
+
+        self.distributed = dist.is_available() and dist.is_initialized()
+        self.is_main = not self.distributed or dist.get_rank() == 0
+        self.saves_checkpoints = self.is_main if saves_checkpoints is None else saves_checkpoints
+        self.ddp = None
+        forward = self.model
+        if self.distributed:
+            # The frozen backbone's buffers never change, don't broadcast them every step.
+            self.ddp = forward = DistributedDataParallel(self.model, broadcast_buffers=False)
+        self.forward = torch.compile(forward) if compile else forward
+
+        self.epoch = 0
+        self.best_val_loss = float('inf')
+        self.best_head_weights = head_state_dict(head)
+        self.epochs_no_improve = 0
+        self.stopped = False
+
+    def state_dict(self):
+        """
+        Everything needed to continue exactly where training stopped. The frozen
+        backbone is not saved, it is rebuilt from the same weights on resume.
+        """
+        generator = getattr(self.train_loader, 'generator', None)
+        return {
+            'head': self.head.state_dict(),
+            'optimizer': self.optimizer.state_dict(),
+            'epoch': self.epoch,
+            'best_val_loss': self.best_val_loss,
+            'best_head_weights': self.best_head_weights,
+            'epochs_no_improve': self.epochs_no_improve,
+            'stopped': self.stopped,
+            'rng': rng_state(),
+            'loader_generator': generator.get_state() if generator is not None else None,
+        }
+
+    def load_state_dict(self, state):
+        self.head.load_state_dict(state['head'])
+        self.optimizer.load_state_dict(state['optimizer'])
+        self.epoch = state['epoch']
+        self.best_val_loss = state['best_val_loss']
+        self.best_head_weights = state['best_head_weights']
+        self.epochs_no_improve = state['epochs_no_improve']
+        self.stopped = state['stopped']
+        set_rng_state(state['rng'])
+        generator = getattr(self.train_loader, 'generator', None)
+        if generator is not None and state['loader_generator'] is not None:
+            generator.set_state(state['loader_generator'])
+
+    def autocast(self):
+        if not self.bf16:
+            return contextlib.nullcontext()
+        return torch.autocast(device_type=self.device.type, dtype=torch.bfloat16)
+
+    def to_device(self, inputs, labels):
+        inputs = inputs.to(self.device, non_blocking=True)
+        if self.channels_last and inputs.dim() == 4:
+            inputs = inputs.contiguous(memory_format=torch.channels_last)
+        return inputs, labels.to(self.device, non_blocking=True)
+
+    def all_reduce(self, *values):
+        # Sums over all processes (no-op when not distributed).
+        if not self.distributed:
+            return values
+        tensor = torch.tensor(values, dtype=torch.float64)
+        dist.all_reduce(tensor, op=dist.ReduceOp.SUM)
+        return tuple(tensor.tolist())
+
+    def set_train_mode(self):
+        # The backbone is frozen, keep its batch norm statistics frozen too.
+        self.model.eval()
+        self.head.train()
+
+    def train_epoch(self):
+        self.set_train_mode()
+        running_loss = 0.0
+        samples = 0
+        self.optimizer.zero_grad()
+        steps = len(self.train_loader)
+        sampler = getattr(self.train_loader, 'sampler', None)
+        if isinstance(sampler, DistributedSampler):
+            sampler.set_epoch(self.epoch)
+
+        profiler = self.profiler
+        data_start = time.perf_counter()
+        for step, (inputs, labels) in enumerate(self.train_loader):
+            profiler.step_start()
+            inputs, labels = self.to_device(inputs, labels)
+            profiler.add('data', time.perf_counter() - data_start)
+            update = (step + 1) % self.accumulation_steps == 0 or step + 1 == steps
+
+            # Only all-reduce the gradients on the batch that updates the weights.
+            sync = self.ddp.no_sync() if self.ddp is not None and not update else contextlib.nullcontext()
+            with sync:
+                with profiler.phase('forward'):
+                    with self.autocast():
+                        outputs = self.forward(inputs)
+                    loss = self.criterion(outputs.float(), labels)
+                with profiler.phase('backward'):
+                    (loss / self.accumulation_steps).backward()
+
+            if update:
+                with profiler.phase('optimizer'):
+                    self.optimizer.step()
+                    self.optimizer.zero_grad()
+
+            running_loss += loss.item() * inputs.size(0)
+            samples += inputs.size(0)
+            profiler.step_end(inputs.size(0))
+            data_start = time.perf_counter()
+
+        running_loss, samples = self.all_reduce(running_loss, samples)
+        return running_loss / max(samples, 1)
+
+    def validate(self):
+        self.model.eval()
+        running_loss = 0.0
+        samples = 0
+        with torch.no_grad():
+            for inputs, labels in self.val_loader:
+                inputs, labels = self.to_device(inputs, labels)
+                with self.autocast():
+                    outputs = self.forward(inputs)
+                running_loss += self.criterion(outputs.float(), labels).item() * inputs.size(0)
+                samples += inputs.size(0)
+        running_loss, samples = self.all_reduce(running_loss, samples)
+        return running_loss / max(samples, 1)
+
+    def fit(self, num_epochs=50, patience=5, best_head_path=None, checkpoint_dir=None, checkpoint_every=1,
+            keep_checkpoints=3, extra_state=None, on_epoch_end=None, verbose=True):
+        """
+        Train until early stopping, then load the best head weights. Returns the best val loss.
+        Starts from self.epoch, so a trainer restored with load_state_dict continues the run.
+        With checkpoint_dir (the folder of this run, see new_run_dir), state_dict() (plus extra_state) is saved
+        every checkpoint_every epochs.
+        on_epoch_end(trainer, epoch, val_loss) can return True to stop the run (e.g. sweep pruning).
+        """
+        log = self.is_main and verbose
+        chrono = Chrono()
+        for epoch in range(self.epoch, num_epochs):
+            if self.stopped:
+                break
+            chrono.start()
+            self.profiler.epoch_start(epoch)
+            epoch_train_loss = self.train_epoch()
+            validation_start = time.perf_counter()
+            epoch_val_loss = self.validate()
+            record = self.profiler.epoch_end(epoch, epoch_train_loss, epoch_val_loss,
+                                             time.perf_counter() - validation_start)
+
+            if log:
+                print(f'Epoch [{epoch+1}/{num_epochs}] '
+                      f'Train Loss: {epoch_train_loss:.4f} | Val Loss: {epoch_val_loss:.4f} | {chrono.stop():.2f} s')
+                print(self.profiler.summary(record))
+
+            if epoch_val_loss < self.best_val_loss:
+                self.best_val_loss = epoch_val_loss
+                self.epochs_no_improve = 0
+                self.best_head_weights = head_state_dict(self.head)
+                if self.is_main and best_head_path is not None:
+                    torch.save(self.best_head_weights, best_head_path)
+                if log:
+                    print(f"  --> New best model at epoch {epoch+1} with val_loss = {self.best_val_loss:.4f}")
+            else:
+                self.epochs_no_improve += 1
+
+            # Every process sees the same averaged val loss, so they all stop together.
+            if self.epochs_no_improve >= patience:
+                if log:
+                    print(f"Early stopping triggered after {epoch+1} epochs!")
+                self.stopped = True
+            if on_epoch_end is not None and on_epoch_end(self, epoch, epoch_val_loss):
+                self.stopped = True
+
+            self.epoch = epoch + 1
+            if self.saves_checkpoints and checkpoint_dir is not None and (self.epoch % checkpoint_every == 0 or self.stopped
+                                                                or self.epoch == num_epochs):
+                path = save_checkpoint({**self.state_dict(), **(extra_state or {})}, checkpoint_dir,
+                                       self.epoch, keep_checkpoints)
+                if log:
+                    print(f"  Checkpoint saved to {path}")
+
+        self.head.load_state_dict(self.best_head_weights)
+        return self.best_val_loss
+
+
+def split_dataset(dataset, val_fraction=0.3, seed=0):
+    val_size = int(round(val_fraction * len(dataset)))
+    return random_split(dataset, [len(dataset) - val_size, val_size],
+                        generator=torch.Generator().manual_seed(seed))
+
+
+def start_emissions_tracker():
+    # codecarbon is only needed for the energy report, don't make it a hard dependency.
+    try:
+        from codecarbon import EmissionsTracker
+    except ImportError:
+        print("codecarbon is not installed, energy is not measured")
+        return None
+    tracker = EmissionsTracker()
+    tracker.start()
+    return tracker
+
+
+def build_model(args):
+    preset = ARCHITECTURES[args.arch]
+    if args.backbone is None and args.head_widths is None:
+        return preset(pretrained=args.pretrained)
+    return KartModel(args.backbone or preset.backbone_name, args.head_widths or (1024, 128, 64),
+                     pretrained=args.pretrained)
+
+
+def add_training_arguments(parser):
+    parser.add_argument('--arch', type=str, default='b4', choices=list(ARCHITECTURES),
+                        help='Preset for the backbone, input size and output names.')
+    parser.add_argument('--backbone', type=str, default=None,
+                        help='Any torchvision classification model name (e.g. resnet50, efficientnet_b0).')
+    parser.add_argument('--input-size', type=int, default=None,
+                        help='Input resolution (default: the preset one).')
+    parser.add_argument('--head-widths', type=parse_widths, default=None,
+                        help='Comma separated hidden layer widths of the head (default: 1024,128,64).')
+    parser.add_argument('--no-pretrained', dest='pretrained', action='store_false',
+                        help='Start from random backbone weights.')
+    parser.add_argument('--csv', type=str, default='dataset.csv',
+                        help='CSV file with the labels.')
+    parser.add_argument('--root', type=str, default='./resizeDataSet',
+                        help='Folder containing the images.')
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--lr', type=float, default=1e-2)
+    parser.add_argument('--epochs', type=int, default=50)
+    parser.add_argument('--patience', type=int, default=5)
+    parser.add_argument('--loss', type=str, default='l1', choices=list(LOSSES))
+    parser.add_argument('--val-fraction', type=float, default=0.3)
+    parser.add_argument('--seed', type=int, default=0,
+                        help='Seed of the train/validation split.')
+    parser.add_argument('--bf16', action='store_true',
+                        help='bfloat16 autocast for the forward pass.')
+    parser.add_argument('--channels-last', action='store_true',
+                        help='Use the channels_last (NHWC) memory format.')
+    parser.add_argument('--compile', action='store_true',
+                        help='Compile the model with torch.compile.')
+    parser.add_argument('--accumulation-steps', type=int, default=1,
+                        help='Batches per optimizer step.')
+    parser.add_argument('--weights', type=str, default='best_model.pth',
+                        help='Where to save the state dict of the best model.')
+    parser.add_argument('--best-head', type=str, default='best_head.pth',
+                        help='Where to save the best head weights during training.')
+    parser.add_argument('--output-prefix', type=str, default=None,
+                        help='Prefix of the exported ONNX files (default: the preset name).')
+    parser.add_argument('--no-emissions', dest='emissions', action='store_false',
+                        help='Do not measure energy with codecarbon.')
+    parser.add_argument('--checkpoint-dir', type=str, default='checkpoints',
+                        help='Folder of the resumable checkpoints, one run_<date-time>_<options hash> '
+                             'subfolder per run.')
+    parser.add_argument('--checkpoint-every', type=int, default=1,
+                        help='Save a checkpoint every N epochs (0 = never).')
+    parser.add_argument('--keep-checkpoints', type=int, default=3,
+                        help='Number of checkpoints kept per run (at least 1).')
+    parser.add_argument('--resume', type=str, nargs='?', const='latest', default=None,
+                        help='Continue from a checkpoint file (default: the latest one of a run with the same '
+                             'options in --checkpoint-dir).')
+    parser.add_argument('--run-log', type=str, default=None,
+                        help='Write the per-epoch (and per-step, for .json) phase timings, images/s, peak RSS '
+                             'and energy to this .json or .csv file.')
+    parser.add_argument('--profile-steps', type=parse_step_range, default=None,
+                        help='Trace these global steps with torch.profiler, e.g. 20-25.')
+    parser.add_argument('--profile-dir', type=str, default='profiles',
+                        help='Folder of the torch.profiler traces.')
+    parser.add_argument('--nproc', type=int, default=1,
+                        help='Training processes on this machine (DistributedDataParallel over gloo when > 1).')
+    parser.add_argument('--nnodes', type=int, default=1,
+                        help='Number of machines taking part in the training.')
+    parser.add_argument('--node-rank', type=int, default=0,
+                        help='Index of this machine, 0 on the one that exports the model.')
+    parser.add_argument('--master-addr', type=str, default='127.0.0.1',
+                        help='Address of the node-rank 0 machine, reachable from the others.')
+    parser.add_argument('--master-port', type=int, default=29500)
+    add_loader_arguments(parser)
+    return parser
+
+
+def run(local_rank, args):
+    """Train with the parsed options; local_rank is the process index on this node in distributed mode."""
+    world_size = args.nnodes * args.nproc
+    rank = args.node_rank * args.nproc + local_rank
+    if world_size > 1:
+        dist.init_process_group('gloo', init_method=f"tcp://{args.master_addr}:{args.master_port}",
+                                rank=rank, world_size=world_size)
+        # One share of the cores per process instead of every process using all of them.
+        torch.set_num_threads(max(1, (os.cpu_count() or 1) // args.nproc))
+    is_main = rank == 0
+
+    preset = ARCHITECTURES[args.arch]
+    input_size = args.input_size or preset.input_size
+    output_prefix = args.output_prefix or (preset.export_name if args.backbone is None else
+                                           f"kart_{args.backbone}_{input_size}")
+
+    checkpoint = None
+    run_dir = None
+    key = run_key(args)
+    if args.resume is not None:
+        path = latest_checkpoint(args.checkpoint_dir, key) if args.resume == 'latest' else args.resume
+        if path is None:
+            raise SystemExit(f"no checkpoint of a run with these options found in {args.checkpoint_dir}")
+        checkpoint = load_checkpoint(path)
+        if args.resume == 'latest':
+            # Continue in the same run folder, its epoch numbers go on from the checkpoint.
+            run_dir = os.path.dirname(path)
+        if is_main:
+            print(f"Resuming from {path} (epoch {checkpoint['epoch']})")
+    if args.resume != 'latest' and args.checkpoint_every > 0:
+        run_dir = new_run_dir(args.checkpoint_dir, key) if is_main else None
+        if world_size > 1:
+            # The first process of every node saves the checkpoints, under the same
+            # run folder name whether --checkpoint-dir is shared or local to each node.
+            names = [os.path.basename(run_dir) if is_main else None]
+            dist.broadcast_object_list(names, src=0)
+            run_dir = os.path.join(args.checkpoint_dir, names[0])
+
+    tracker = start_emissions_tracker() if args.emissions and is_main else None
+
+    # Same head initialisation (and random backbone with --no-pretrained) on every run and every process.
+    torch.manual_seed(args.seed)
+
+    # With --image-cache the PNGs are decoded and resized once, then read from a memory-mapped file.
+    dataset = make_dataset(args.csv, args.root, input_size, args.image_cache, args.roi, args.shards,
+                           args.subset, args.image_cache_dir)
+    if checkpoint is not None:
+        if checkpoint.get('roi') != args.roi:
+            raise SystemExit(f"the checkpoint was trained with --roi {format_roi(checkpoint.get('roi'))}")
+        if checkpoint['dataset_size'] != len(dataset):
+            raise SystemExit(f"the checkpoint was made on {checkpoint['dataset_size']} samples, "
+                             f"the dataset now has {len(dataset)}")
+        train_dataset = Subset(dataset, checkpoint['train_indices'])
+        val_dataset = Subset(dataset, checkpoint['val_indices'])
+    else:
+        train_dataset, val_dataset = split_dataset(dataset, args.val_fraction, args.seed)
+
+    if world_size > 1:
+        # Each process sees 1/world_size of every epoch; --batch-size is per process.
+        # The validation sampler pads with a few repeated samples to even out the shards.
+        train_loader = make_loader(train_dataset, args.batch_size,
+                                   sampler=DistributedSampler(train_dataset, world_size, rank, seed=args.seed),
+                                   **loader_options_from_args(args))
+        val_loader = make_loader(val_dataset, args.batch_size,
+                                 sampler=DistributedSampler(val_dataset, world_size, rank, shuffle=False),
+                                 **loader_options_from_args(args))
+        device = torch.device('cpu')
+    else:
+        train_loader = make_loader(train_dataset, args.batch_size, shuffle=True,
+                                   generator=torch.Generator().manual_seed(args.seed),
+                                   **loader_options_from_args(args))
+        val_loader = make_loader(val_dataset, args.batch_size, shuffle=False, **loader_options_from_args(args))
+        device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+
+    model = build_model(args)
+
+    profiler = TrainingProfiler(record_steps=args.run_log is not None and not args.run_log.endswith('.csv'),
+                                tracker=tracker, profile_steps=args.profile_steps if is_main else None,
+                                profile_dir=args.profile_dir, device=device)
+    trainer = Trainer(model, model.classifier, train_loader, val_loader, args.loss, args.lr, device,
+                      args.bf16, args.channels_last, args.compile, args.accumulation_steps, profiler,
+                      saves_checkpoints=local_rank == 0)
+    if checkpoint is not None:
+        trainer.load_state_dict(checkpoint)
+
+    split_state = {'dataset_size': len(dataset), 'train_indices': list(train_dataset.indices),
+                   'val_indices': list(val_dataset.indices), 'roi': args.roi}
+    best_val_loss = trainer.fit(args.epochs, args.patience, args.best_head,
+                                run_dir if args.checkpoint_every > 0 else None,
+                                args.checkpoint_every, args.keep_checkpoints, split_state)
+
+    if tracker is not None:
+        tracker.stop()
+
+    if is_main:
+        print(f"Best val_loss = {best_val_loss:.4f}")
+        if args.run_log is not None:
+            config = {key: value for key, value in vars(args).items() if isinstance(value, (str, int, float, bool))}
+            print(f"Run log written to {profiler.write(args.run_log, {**config, 'world_size': world_size})}")
+
+        model = model.to(memory_format=torch.contiguous_format)
+        torch.save(model.state_dict(), args.weights)
+        print(f"Model weights saved to {args.weights}")
+
+        # Combined model plus separate backbone (image -> features) and head
+        # (features -> lat/lon) graphs, so the head can be retrained on cached features.
+        exported = export_split(model, input_size, output_prefix, device, args.roi)
+        for part, path in exported.items():
+            print(f"Model ({part}) has been exported to {path}")
+
+    if world_size > 1:
+        dist.barrier()
+        dist.destroy_process_group()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Train a kart position model.')
+    add_training_arguments(parser)
+    args = parser.parse_args(argv)
+    if args.keep_checkpoints < 1:
+        parser.error('--keep-checkpoints must be at least 1')
+
+    if args.nproc * args.nnodes == 1:
+        run(0, args)
+        return
+
+    # Build the image cache and download the backbone weights once per node,
+    # not concurrently in every worker.
+    if args.image_cache:
+        make_dataset(args.csv, args.root, args.input_size or ARCHITECTURES[args.arch].input_size, True, args.roi,
+                     args.shards, args.subset, args.image_cache_dir)
+    if args.pretrained:
+        build_model(args)
+
+    mp.spawn(run, args=(args,), nprocs=args.nproc, join=True)
+
+
+if __name__ == '__main__':
+    main()
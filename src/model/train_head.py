@@ -0,0 +1,76 @@
+import argparse
+
+import torch
+from torch.utils.data import DataLoader
+
+from src.model.export import export_split
+from src.model.feature_cache import DTYPES, FeatureDataset, get_feature_cache
+from src.model.networks import ARCHITECTURES
+from src.model.train import LOSSES, Trainer, split_dataset
+from src.utils.roi import add_roi_argument
+
+
+def train_head(model, dataset, batch_size=32, lr=1e-2, num_epochs=50, patience=5, device='cpu', seed=0,
+               loss='l1'):
+    """
+    Train model.classifier on cached (features, labels) pairs with the same loss,
+    optimizer, split and early stopping as the image training. Loads the best
+    head weights into the model and returns the best validation loss.
+    """
+    train_dataset, val_dataset = split_dataset(dataset, 0.3, seed)
+    train_loader = DataLoader(train_dataset, batch_size=batch_size, shuffle=True)
+    val_loader = DataLoader(val_dataset, batch_size=batch_size, shuffle=False)
+
+    trainer = Trainer(model.classifier, model.classifier, train_loader, val_loader, loss, lr, device)
+    return trainer.fit(num_epochs, patience)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Train the regression head on cached backbone features.')
+    parser.add_argument('--arch', type=str, default='b4', choices=list(ARCHITECTURES),
+                        help='Model architecture.')
+    parser.add_argument('--csv', type=str, default='dataset.csv',
+                        help='CSV file with the labels.')
+    parser.add_argument('--root', type=str, default='./resizeDataSet',
+                        help='Folder containing the images.')
+    parser.add_argument('--cache-dir', type=str, default='feature_cache',
+                        help='Folder where the feature caches are stored.')
+    parser.add_argument('--dtype', type=str, default='float16', choices=list(DTYPES),
+                        help='Storage type of the cached features.')
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--lr', type=float, default=1e-2)
+    parser.add_argument('--epochs', type=int, default=50)
+    parser.add_argument('--patience', type=int, default=5)
+    parser.add_argument('--loss', type=str, default='l1', choices=list(LOSSES))
+    parser.add_argument('--seed', type=int, default=0,
+                        help='Seed of the train/validation split.')
+    parser.add_argument('--weights', type=str, default='best_model.pth',
+                        help='Where to save the state dict of the full model (backbone + trained head).')
+    parser.add_argument('--output-prefix', type=str, default=None,
+                        help='Prefix of the exported ONNX files (default: same names as the training scripts).')
+    add_roi_argument(parser)
+    args = parser.parse_args()
+
+    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    model_class = ARCHITECTURES[args.arch]
+    model = model_class(pretrained=True)
+
+    # The backbone is frozen, so its features only need to be computed once.
+    path = get_feature_cache(args.arch, args.csv, args.root, args.cache_dir, args.dtype,
+                             device=device, model=model, roi=args.roi)
+    best_val_loss = train_head(model, FeatureDataset(path), args.batch_size, args.lr, args.epochs,
+                               args.patience, device, args.seed, args.loss)
+    print(f"Best val_loss = {best_val_loss:.4f}")
+
+    model.to(device)
+    torch.save(model.state_dict(), args.weights)
+    print(f"Model weights saved to {args.weights}")
+
+    exported = export_split(model, model_class.input_size, args.output_prefix or model_class.export_name, device,
+                            args.roi)
+    for part, path in exported.items():
+        print(f"Model ({part}) has been exported to {path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,22 @@
+import numpy as np
+
+EARTH_RADIUS_M = 6378100  # Same radius as spatial_analysis.calculate_haversine_distance
+
+
+def haversine_distances(pred, true):
+    # Vectorized version of spatial_analysis.calculate_haversine_distance,
+    # inputs are arrays of (lat, lon) in degrees.
+    pred = np.radians(pred)
+    true = np.radians(true)
+    delta = true - pred
+    haversine_term = (np.sin(delta[:, 0] / 2) ** 2
+                      + np.cos(pred[:, 0]) * np.cos(true[:, 0]) * np.sin(delta[:, 1] / 2) ** 2)
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(haversine_term))
+
+
+def summarize_errors(errors):
+    return {
+        'mean_m': float(np.mean(errors)),
+        'median_m': float(np.median(errors)),
+        'p95_m': float(np.percentile(errors, 95)),
+    }
@@ -0,0 +1,68 @@
+import json
+
+# (left, top, right, bottom) as fractions of the frame, so the same profile works
+# on the raw frames and on the resized dataset.
+ROI_PROFILES = {
+    'full': None,
+    # Onboard camera: drop the sky at the top and the kart hood and steering wheel at the bottom.
+    'onboard': (0.0, 0.2, 1.0, 0.75),
+}
+
+
+def parse_roi(value):
+    """
+    ROI from a profile name (ROI_PROFILES), a JSON file mapping camera names to
+    boxes ("file.json:camera") or "left,top,right,bottom" fractions. None = full frame.
+    """
+    if value is None or value in ROI_PROFILES:
+        return ROI_PROFILES.get(value)
+    if '.json:' in value:
+        path, camera = value.rsplit(':', 1)
+        with open(path, 'r') as f:
+            profiles = json.load(f)
+        if camera not in profiles:
+            raise ValueError(f"No camera {camera} in {path}")
+        value = profiles[camera]
+        if value is None:
+            return None
+    box = tuple(float(part) for part in (value.split(',') if isinstance(value, str) else value))
+    if len(box) != 4:
+        raise ValueError(f"ROI needs 4 values (left,top,right,bottom), got {value}")
+    left, top, right, bottom = box
+    if not (0.0 <= left < right <= 1.0 and 0.0 <= top < bottom <= 1.0):
+        raise ValueError(f"ROI must satisfy 0 <= left < right <= 1 and 0 <= top < bottom <= 1, got {value}")
+    return None if box == (0.0, 0.0, 1.0, 1.0) else box
+
+
+def add_roi_argument(parser):
+    parser.add_argument('--roi', type=parse_roi, default=None,
+                        help=f"Region of interest cropped from every frame before the resize: a profile "
+                             f"({', '.join(ROI_PROFILES)}), cameras.json:<camera> or left,top,right,bottom "
+                             f"fractions. Stored in the exported ONNX model.")
+    return parser
+
+
+def format_roi(roi):
+    # Inverse of parse_roi, used for the ONNX metadata and the cache names.
+    return 'full' if roi is None else ','.join(f"{value:g}" for value in roi)
+
+
+def crop_box(roi, width, height):
+    left, top, right, bottom = roi
+    return (int(round(left * width)), int(round(top * height)),
+            int(round(right * width)), int(round(bottom * height)))
+
+
+class RoiCrop:
+    """Crops a PIL image to the ROI, before the resize to the model input size."""
+
+    def __init__(self, roi):
+        self.roi = roi
+
+    def __call__(self, image):
+        if self.roi is None:
+            return image
+        return image.crop(crop_box(self.roi, *image.size))
+
+    def __repr__(self):
+        return f"{type(self).__name__}({format_roi(self.roi)})"
@@ -0,0 +1,154 @@
+import json
+import math
+
+import numpy as np
+
+from src.utils.geo import EARTH_RADIUS_M
+
+
+class Track:
+    """
+    Track centre line as a polyline in local metres, parametrised by arc length.
+
+    points: array of (lat, lon) in degrees.
+    closed: whether the last point connects back to the first one (one lap).
+    """
+
+    def __init__(self, points, closed=True):
+        self.points = np.asarray(points, dtype=np.float64)
+        if len(self.points) < 2:
+            raise ValueError("A track needs at least two points")
+        self.closed = closed
+
+        # Local equirectangular projection, accurate to well below a metre at karting scale.
+        self.origin = self.points.mean(axis=0)
+        self.lon_scale = math.cos(math.radians(self.origin[0]))
+        self.xy = self.to_xy(self.points)
+
+        vertices = np.vstack([self.xy, self.xy[:1]]) if closed else self.xy
+        self.segment_start = vertices[:-1]
+        self.segment_vector = vertices[1:] - vertices[:-1]
+        self.segment_length = np.linalg.norm(self.segment_vector, axis=1)
+        self.cumulative = np.concatenate([[0.0], np.cumsum(self.segment_length)])
+        self.length = float(self.cumulative[-1])
+
+    @classmethod
+    def from_files(cls, coordinates_path, world_path=None, circuit_name='Ancenis', min_spacing_m=1.0,
+                   start_radius_m=15.0):
+        """
+        Build the track from a recorded coordinates file (data/coordinates.json).
+        When the circuit is found in world_path (data/theworld.json), one lap is
+        cut between two consecutive passes of its start line.
+        """
+        with open(coordinates_path, 'r') as f:
+            data = json.load(f)
+        points = [(entry['lat'], entry['lon']) if isinstance(entry, dict) else tuple(entry) for entry in data]
+        points = thin_points(np.array(points, dtype=np.float64), min_spacing_m)
+
+        start = None
+        if world_path is not None:
+            with open(world_path, 'r') as f:
+                circuits = json.load(f)['tracks']
+            circuit = next((track for track in circuits if track['name'] == circuit_name), None)
+            if circuit is not None:
+                p1, p2 = circuit['start']['p1'], circuit['start']['p2']
+                start = ((p1['lat'] + p2['lat']) / 2, (p1['lon'] + p2['lon']) / 2)
+
+        if start is not None:
+            lap = cut_lap(points, start, start_radius_m)
+            if lap is not None:
+                return cls(lap, closed=True)
+
+        return cls(points, closed=False)
+
+    def to_xy(self, points):
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        x = np.radians(points[:, 1] - self.origin[1]) * EARTH_RADIUS_M * self.lon_scale
+        y = np.radians(points[:, 0] - self.origin[0]) * EARTH_RADIUS_M
+        return np.stack([x, y], axis=1)
+
+    def to_latlon(self, xy):
+        xy = np.asarray(xy, dtype=np.float64).reshape(-1, 2)
+        lat = self.origin[0] + np.degrees(xy[:, 1] / EARTH_RADIUS_M)
+        lon = self.origin[1] + np.degrees(xy[:, 0] / (EARTH_RADIUS_M * self.lon_scale))
+        return np.stack([lat, lon], axis=1)
+
+    def project(self, lat, lon):
+        """Arc length of the closest point of the track, and the distance to it in metres."""
+        point = self.to_xy([(lat, lon)])[0]
+        relative = point - self.segment_start
+        squared_length = np.maximum(self.segment_length ** 2, 1e-12)
+        t = np.clip(np.sum(relative * self.segment_vector, axis=1) / squared_length, 0.0, 1.0)
+        closest = self.segment_start + t[:, None] * self.segment_vector
+        distances = np.linalg.norm(closest - point, axis=1)
+        index = int(np.argmin(distances))
+        return float(self.cumulative[index] + t[index] * self.segment_length[index]), float(distances[index])
+
+    def position(self, s):
+        """(lat, lon) at arc length s (wrapped on closed tracks, clamped on open ones)."""
+        lat, lon = self.to_latlon(self.position_xy(s))[0]
+        return float(lat), float(lon)
+
+    def position_xy(self, s):
+        s = s % self.length if self.closed else min(max(s, 0.0), self.length)
+        index = int(np.searchsorted(self.cumulative, s, side='right') - 1)
+        index = min(max(index, 0), len(self.segment_length) - 1)
+        t = (s - self.cumulative[index]) / max(self.segment_length[index], 1e-12)
+        return self.segment_start[index] + t * self.segment_vector[index]
+
+    def delta(self, s_from, s_to):
+        """Signed distance along the track, taking the short way round on closed tracks."""
+        d = s_to - s_from
+        if self.closed:
+            d = (d + self.length / 2) % self.length - self.length / 2
+        return d
+
+    def interpolate(self, s_from, s_to, fraction):
+        return self.position(s_from + fraction * self.delta(s_from, s_to))
+
+    def interpolate_fixes(self, fix_from, s_from, fix_to, s_to, fraction):
+        """
+        Follow the track between two fixes while blending their lateral offsets
+        from the centre line, so the path joins both fixes exactly.
+        """
+        offset_from = self.to_xy([fix_from])[0] - self.position_xy(s_from)
+        offset_to = self.to_xy([fix_to])[0] - self.position_xy(s_to)
+        xy = (self.position_xy(s_from + fraction * self.delta(s_from, s_to))
+              + (1.0 - fraction) * offset_from + fraction * offset_to)
+        lat, lon = self.to_latlon(xy)[0]
+        return float(lat), float(lon)
+
+
+def thin_points(points, min_spacing_m):
+    # Drop GPS samples closer than min_spacing_m to the previous kept point
+    # (stationary kart, duplicated fixes).
+    if min_spacing_m <= 0 or len(points) < 2:
+        return points
+    lon_scale = math.cos(math.radians(points[:, 0].mean()))
+    kept = [0]
+    for i in range(1, len(points)):
+        d_lat = math.radians(points[i, 0] - points[kept[-1], 0]) * EARTH_RADIUS_M
+        d_lon = math.radians(points[i, 1] - points[kept[-1], 1]) * EARTH_RADIUS_M * lon_scale
+        if math.hypot(d_lat, d_lon) >= min_spacing_m:
+            kept.append(i)
+    return points[kept]
+
+
+def cut_lap(points, start, radius_m, min_lap_m=200.0):
+    """Points between the first two passes within radius_m of the start line, or None."""
+    lon_scale = math.cos(math.radians(start[0]))
+    d_lat = np.radians(points[:, 0] - start[0]) * EARTH_RADIUS_M
+    d_lon = np.radians(points[:, 1] - start[1]) * EARTH_RADIUS_M * lon_scale
+    distances = np.hypot(d_lat, d_lon)
+
+    steps = np.hypot(np.diff(np.radians(points[:, 0])), np.diff(np.radians(points[:, 1])) * lon_scale)
+    arc = np.concatenate([[0.0], np.cumsum(steps) * EARTH_RADIUS_M])
+
+    passes = [i for i in range(1, len(points) - 1)
+              if distances[i] < radius_m and distances[i] <= distances[i - 1] and distances[i] <= distances[i + 1]]
+    for first in passes:
+        # GPS jitter can produce several minima on one pass, skip those.
+        following = [i for i in passes if arc[i] - arc[first] >= min_lap_m]
+        if following:
+            return points[first:following[0]]
+    return None
@@ -1,5 +1,7 @@
 import os
 
+from src.dataset.subset import is_subset, subset_paths
+
 def directory_to_list(dir):
     ext = (".png", ".jpg", ".jpeg")
 
@@ -11,7 +13,9 @@ def directory_to_list(dir):
 
 def validate_source(source):
     # convert source format into standard list of file paths
-    if isinstance(source, list):
+    if is_subset(source):
+        source_list = subset_paths(source)
+    elif isinstance(source, list):
         source_list = [f for f in source if os.path.isfile(f)]
     elif os.path.isdir(source):
         source_list = directory_to_list(source)
@@ -20,4 +24,26 @@ def validate_source(source):
     else:
         raise ValueError('"source" expected as file, list or directory.')
 
-    return source_list
\ No newline at end of file
+    return source_list
+
+def format_table(rows, columns):
+    # rows: list of dicts, columns: list of (key, header, format spec).
+    headers = [header for _, header, _ in columns]
+    cells = [[format(row[key], spec) if row.get(key) is not None else '-' for key, _, spec in columns]
+             for row in rows]
+    widths = [max(len(str(value)) for value in column) for column in zip(headers, *cells)]
+
+    lines = [" | ".join(header.ljust(width) for header, width in zip(headers, widths)),
+             "-+-".join("-" * width for width in widths)]
+    for row in cells:
+        lines.append(" | ".join(value.ljust(width) if spec == 's' else value.rjust(width)
+                                for value, width, (_, _, spec) in zip(row, widths, columns)))
+    return "\n".join(lines)
+
+
+def model_size_mb(path):
+    # Large models can be exported with their weights in a separate .data file.
+    size = os.path.getsize(path)
+    if os.path.exists(path + '.data'):
+        size += os.path.getsize(path + '.data')
+    return size / 1e6